@@ -0,0 +1,95 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+# Raised by a compute function when the aggregate cannot be built right now
+class AggregateError(Exception):
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Precomputed aggregates served stale-while-revalidate.
+#
+# Entries are kept in the given cache (so they follow whatever backend the app
+# cache uses). Every key that was computed successfully is recomputed in the
+# background by run_periodic() until nobody has asked for it for key_ttl
+# seconds. All methods run on the shared client loop; cache reads and writes
+# are handed to the given executor so they never block it.
+class AggregateStore:
+    def __init__(self, cache, compute, prefix, max_age, key_ttl=86400, executor=None):
+        self._cache = cache
+        self._executor = executor
+        self._compute = compute  # coroutine function(*key) -> payload dict
+        self._prefix = prefix
+        self.max_age = max_age
+        self.key_ttl = key_ttl
+        self._keys = {}  # key -> time it was last asked for
+        self._refreshing = {}
+
+    def _cache_key(self, key):
+        return f"{self._prefix}:" + ":".join(str(part) for part in key)
+
+    async def _cache_call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def peek(self, key):
+        return await self._cache_call(self._cache.get, self._cache_key(key))
+
+    # Return the stored entry for key, computing it first if there is none.
+    # Entries older than max_age are returned as-is with 'stale' set while a
+    # refresh runs in the background.
+    async def get(self, key):
+        entry = await self.peek(key)
+        if entry is None:
+            # Keys whose computation fails are never refreshed in the background
+            entry = await self.refresh(key)
+            self._keys[key] = time.time()
+            return entry
+        self._keys[key] = time.time()
+        stale = time.time() - entry['computed_ts'] > self.max_age
+        if stale:
+            self._schedule(key)
+        return dict(entry, stale=stale)
+
+    # Recompute key, sharing the work with any refresh already in flight
+    async def refresh(self, key):
+        return dict(await asyncio.shield(self._schedule(key)), stale=False)
+
+    def _schedule(self, key):
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._recompute(key))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+            # Background refreshes may fail; keep serving the previous entry
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _recompute(self, key):
+        payload = await self._compute(*key)
+        now = datetime.now(timezone.utc)
+        entry = dict(payload, computed_at=now.isoformat(), computed_ts=now.timestamp())
+        await self._cache_call(self._cache.set, self._cache_key(key), entry, timeout=0)
+        return entry
+
+    # Refresh every known key whose entry is older than max_age, forever.
+    # Keys nobody asked for within key_ttl are forgotten.
+    async def run_periodic(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            for key, requested_at in list(self._keys.items()):
+                if time.time() - requested_at > self.key_ttl:
+                    del self._keys[key]
+                    continue
+                entry = await self.peek(key)
+                if entry is None or time.time() - entry['computed_ts'] > self.max_age:
+                    try:
+                        await self.refresh(key)
+                    except Exception as err:
+                        logger.warning("Failed to refresh aggregate %s: %s", key, err)
@@ -1,72 +1,421 @@
 import os
-import aiohttp
+import hmac
+import time
 import asyncio
+import threading
+import logging
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, jsonify, request, render_template
 from dotenv import load_dotenv
 from flask_caching import Cache
-from datetime import datetime, timedelta, timezone
 
-# Load environment variables from .env file
+# Load environment variables from .env file (before the local modules below,
+# which read their settings at import time)
 load_dotenv()
 
-app = Flask(__name__)
-
-# Configure Flask-Caching
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+import telemetry
+from telemetry import trace_id, new_trace_id
+from blizzard_client import client, api_url, parse_regions, SingleFlight
+import json_codec
+from json_codec import FastJSONProvider
+from http_caching import COMPRESS_MIN_SIZE, body_etag, choose_encoding, compress
+from ratelimit import BACKGROUND, with_priority
+from response_cache import TTL_CLASSES, STALE_TTL, ttl_class, ttl_for
+from aggregates import AggregateStore, AggregateError
+from catalog import LOCALES, CatalogStore
+from oauth import TokenManager
+from profiling import Profiler, current_profile
+import snapshots
+from errors import InvalidRequest
+from leaderboards import RIFT_LEADERBOARDS, is_leaderboard_name, flatten_leaderboard, merge_leaderboards, paginate, filter_rows, project, tag_region, BattleTagIndex
+
+# Flask runs async views by starting a fresh event loop for every request,
+# which would leave the pooled client (bound to its own loop) unusable and
+# serialise upstream I/O per request. Run them on the shared client loop
+# instead so the upstream calls of all in-flight requests overlap there.
+class BlizzardFlask(Flask):
+    def async_to_sync(self, func):
+        def wrapper(*args, **kwargs):
+            return client.run(func(*args, **kwargs))
+        return wrapper
+
+BlizzardFlask.json_provider_class = FastJSONProvider
+app = BlizzardFlask(__name__)
+
+# Leveled logging; every line carries the trace id of the request it belongs to
+telemetry.install_log_trace_ids()
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s',
+)
+logger = logging.getLogger('app')
+
+# Each request gets a trace id (the caller's X-Request-ID when given), echoed
+# in the response, and is timed per route for /metrics
+@app.before_request
+def start_request_trace():
+    request.trace_token = trace_id.set(request.headers.get('X-Request-ID') or new_trace_id())
+    request.started_at = time.perf_counter()
+    telemetry.http_requests_in_flight.inc()
+
+@app.after_request
+def finish_request_trace(response):
+    telemetry.http_request_duration.observe(
+        time.perf_counter() - request.started_at,
+        route=request.endpoint or 'unknown', method=request.method, status=response.status_code,
+    )
+    response.headers['X-Request-ID'] = trace_id.get()
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    if hasattr(request, 'trace_token'):
+        telemetry.http_requests_in_flight.dec()
+        trace_id.reset(request.trace_token)
+
+# Configure Flask-Caching. The default backend is an on-disk LRU store shared
+# by all worker processes; CACHE_TYPE=RedisCache (with CACHE_REDIS_URL) or
+# SimpleCache can be used instead.
+cache = Cache(app, config={
+    'CACHE_TYPE': os.getenv('CACHE_TYPE', 'response_cache.SQLiteLRUCache'),
+    'CACHE_DIR': os.getenv('CACHE_DIR', os.path.join(app.root_path, '.cache')),
+    'CACHE_THRESHOLD': int(os.getenv('CACHE_THRESHOLD', 5000)),
+    'CACHE_MAX_BYTES': int(os.getenv('CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+    'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+    'CACHE_DEFAULT_TIMEOUT': TTL_CLASSES['default'],
+})
+
+# On-demand profiling of single requests, off unless PROFILING_ENABLED is set.
+# A request sent with ?profile=1 or an 'X-Profile: 1' header (plus an
+# 'X-Profile-Token' header when PROFILING_TOKEN is set) is sampled while it
+# runs; its collapsed stacks and time breakdown are saved to PROFILE_DIR under
+# a profile id (returned in X-Profile-Id) and summarised in a Server-Timing
+# header.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(cache.config['CACHE_DIR'], 'profiles'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+
+profiler = Profiler(PROFILE_DIR, PROFILE_INTERVAL_MS / 1000)
+if PROFILING_ENABLED:
+    profiler.install(client.loop)
+
+def profiling_allowed():
+    return PROFILING_ENABLED and (
+        not PROFILING_TOKEN or hmac.compare_digest(request.headers.get('X-Profile-Token', ''), PROFILING_TOKEN))
+
+@app.before_request
+def start_profile():
+    if request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+        if profiling_allowed():
+            request.profile = profiler.start(trace_id.get())
+            request.profile_token = current_profile.set(request.profile.id)
+
+# Only the request that started a profile stops it
+@app.after_request
+def finish_profile(response):
+    if not hasattr(request, 'profile'):
+        return response
+    profile = profiler.stop(request.profile.id)
+    if profile is None:
+        return response
+    summary = profile.summary()
+    timings = [
+        f"total;dur={summary['wall_ms']}",
+        f"cpu;dur={summary['cpu_ms']}",
+        f"wait;dur={summary['wait_ms']}",
+    ]
+    timings += [f'{kind};dur={io["ms"]};desc="{io["calls"]} calls"' for kind, io in summary['io'].items()]
+    response.headers['Server-Timing'] = ', '.join(timings)
+    response.headers['X-Profile-Id'] = profile.id
+    return response
+
+# A request that failed before after_request ran still has its profile saved
+@app.teardown_request
+def end_profile(exc):
+    if hasattr(request, 'profile'):
+        profiler.stop(request.profile.id)
+        current_profile.reset(request.profile_token)
+
+# A saved profile: collapsed stacks (for flamegraph.pl or speedscope), or
+# the time breakdown with ?format=json
+@app.route('/debug/profiles/<string:profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    if not profiling_allowed():
+        return jsonify({"error": "Not found"}), 404
+    json_format = request.args.get('format') == 'json'
+    try:
+        with open(profiler.path(profile_id, 'json' if json_format else 'folded'), 'rb') as f:
+            body = f.read()
+    except FileNotFoundError:
+        return jsonify({"error": "Profile not found"}), 404
+    return app.response_class(body, mimetype='application/json' if json_format else 'text/plain')
+
+# The app cache does blocking disk I/O and unpickles large bodies; async code
+# goes through cache_get/cache_set, which run it on this pool so the client
+# loop keeps serving upstream I/O meanwhile
+CACHE_IO_THREADS = int(os.getenv('CACHE_IO_THREADS', 4))
+cache_executor = ThreadPoolExecutor(max_workers=CACHE_IO_THREADS, thread_name_prefix='cache-io')
+
+async def cache_get(key):
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, cache.get, key)
+
+async def cache_set(key, value, timeout=None):
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, lambda: cache.set(key, value, timeout=timeout))
 
 # Blizzard API credentials
 CLIENT_ID = os.getenv('BLIZZARD_CLIENT_ID')
 CLIENT_SECRET = os.getenv('BLIZZARD_CLIENT_SECRET')
 
+# Maximum number of per-hero upstream fetches in flight for a single request
+HERO_FETCH_CONCURRENCY = int(os.getenv('HERO_FETCH_CONCURRENCY', 8))
+
+# /api/heroes/batch: heroes accepted per call and upstream fetches in flight
+HERO_BATCH_MAX = 500
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 32))
+
+# /api/most_used_items: leaderboard rows scanned by default, the upper bound for
+# the 'top' query argument, and upstream fetches in flight per request
+MOST_USED_DEFAULT_TOP = 15
+MOST_USED_MAX_TOP = 1000
+MOST_USED_CONCURRENCY = int(os.getenv('MOST_USED_CONCURRENCY', 16))
+
+# Most used items aggregates: age after which an entry is served stale and
+# recomputed, and how often the background job looks for stale entries (0 = off)
+MOST_USED_MAX_AGE = int(os.getenv('MOST_USED_MAX_AGE', 3600))
+MOST_USED_REFRESH_INTERVAL = int(os.getenv('MOST_USED_REFRESH_INTERVAL', 600))
+# Seconds after its last request an aggregate stops being refreshed
+MOST_USED_KEY_TTL = int(os.getenv('MOST_USED_KEY_TTL', 86400))
+
+# Page size bounds for the flattened leaderboard endpoints
+LEADERBOARD_DEFAULT_LIMIT = 100
+LEADERBOARD_MAX_LIMIT = 10000
+
+# Seconds a flattened leaderboard (and its BattleTag index entries) stays fresh
+LEADERBOARD_CACHE_TIMEOUT = TTL_CLASSES['leaderboard']
+# Leaderboards held in the in-memory BattleTag index (per worker process)
+BATTLETAG_INDEX_MAX_BOARDS = int(os.getenv('BATTLETAG_INDEX_MAX_BOARDS', 100))
+
+# Static game data catalog: locales preloaded at startup, region it is
+# fetched from, where it is saved, and how often it is checked for staleness
+CATALOG_LOCALES = [locale.strip() for locale in os.getenv('CATALOG_LOCALES', 'en_US').split(',') if locale.strip()]
+CATALOG_REGION = os.getenv('CATALOG_REGION', 'us')
+CATALOG_DIR = os.getenv('CATALOG_DIR', os.path.join(cache.config['CACHE_DIR'], 'catalog'))
+CATALOG_REFRESH_INTERVAL = int(os.getenv('CATALOG_REFRESH_INTERVAL', 3600))
+
 # Blizzard OAuth token endpoint
-AUTH_URL = "https://oauth.battle.net/token"
-
-# Global variables to store token and its expiry
-access_token = None
-token_expiry = datetime.now(timezone.utc)  # Initialize as timezone-aware
-
-# Asynchronous function to authenticate and get OAuth2 token with expiry handling
-async def get_oauth_token():
-    global access_token, token_expiry
-    # Ensure both datetime objects are timezone-aware
-    if access_token and datetime.now(timezone.utc) < token_expiry:
-        return access_token
-    
+AUTH_URL = os.getenv('BLIZZARD_AUTH_URL', "https://oauth.battle.net/token")
+
+# Concurrent cache misses for the same upstream URL share a single upstream request
+upstream_flight = SingleFlight()
+telemetry.registry.gauge('upstream_coalesced_in_flight', "Distinct upstream fetches being shared", read=upstream_flight.in_flight)
+telemetry.registry.gauge('upstream_rate_limit_queued', "Upstream calls waiting for the rate limiter", read=client.limiter.queued)
+
+# Ask the OAuth endpoint for a new token; returns (access_token, expires_in)
+async def request_oauth_token():
     payload = {'grant_type': 'client_credentials'}
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(AUTH_URL, auth=aiohttp.BasicAuth(CLIENT_ID, CLIENT_SECRET), data=payload) as response:
-            if response.status == 200:
-                token_data = await response.json()
-                access_token = token_data.get('access_token')
-                expires_in = token_data.get('expires_in', 3600)  # default to 1 hour
-                token_expiry = datetime.now(timezone.utc) + timedelta(seconds=expires_in - 60)  # timezone-aware
-                return access_token
-            else:
-                raise Exception(f"Failed to get token: {response.status} - {await response.text()}")
+    # Reuse the pooled session so the token request shares keep-alive sockets
+    async with client.session.post(AUTH_URL, auth=aiohttp.BasicAuth(CLIENT_ID, CLIENT_SECRET), data=payload) as response:
+        if response.status == 200:
+            token_data = await response.json()
+            expires_in = token_data.get('expires_in', 3600)  # default to 1 hour
+            telemetry.token_refreshes.inc(result='success')
+            logger.info("OAuth token refreshed, valid for %ss", expires_in)
+            return token_data.get('access_token'), expires_in
+        else:
+            telemetry.token_refreshes.inc(result='failure')
+            logger.error("OAuth token refresh failed: %s", response.status)
+            raise Exception(f"Failed to get token: {response.status} - {await response.text()}")
+
+# The OAuth token is shared by all workers through the app cache and renewed
+# in the background before it expires
+oauth_tokens = TokenManager(cache, request_oauth_token, executor=cache_executor)
 
 # Asynchronous function to fetch general data from Blizzard API with caching
-@cache.memoize(timeout=300)  # Cache for 5 minutes
 async def fetch_data(url):
-    token = await get_oauth_token()
+    body, status_code = await fetch_body(url)
+    return json_codec.loads(body), status_code
+
+# Fetch an upstream JSON document as raw bytes, with caching.
+# Cached bodies are stored under 'body:<url>' and their freshness/validators
+# under 'meta:<url>', so a revalidation that comes back 304 only rewrites the
+# small metadata entry. Expired responses are still served (stale-while-
+# revalidate) while a conditional request refreshes them in the background.
+async def fetch_body(url):
+    started = time.perf_counter()
+    meta = await cache_get(f"meta:{url}")
+    cached = await cache_get(f"body:{url}") if meta is not None else None
+    profiler.add_io('cache', time.perf_counter() - started)
+    if cached is not None:
+        if time.time() - meta['fetched_at'] >= ttl_for(url):
+            telemetry.cache_lookups.inc(ttl_class=ttl_class(url), result='stale')
+            revalidate(url, meta, cached)
+        else:
+            telemetry.cache_lookups.inc(ttl_class=ttl_class(url), result='hit')
+        return cached
+
+    telemetry.cache_lookups.inc(ttl_class=ttl_class(url), result='miss')
+    return await upstream_flight.do(url, lambda: fetch_upstream(url))
+
+# Refresh a stale entry in the background, unless a refresh is already running
+def revalidate(url, meta, cached):
+    refresh = upstream_flight.do(url, lambda: fetch_upstream(url, meta, cached))
+    task = asyncio.ensure_future(with_priority(BACKGROUND, refresh))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+async def fetch_upstream(url, meta=None, cached=None):
+    token = await oauth_tokens.get()
     if not token:
-        return {"error": "No access token available."}, 500
+        return json_codec.dumps({"error": "No access token available."}), 500
 
     headers = {'Authorization': f'Bearer {token}'}
+    # Conditional request when we hold a copy: an unchanged resource costs a 304
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
     
-    async with aiohttp.ClientSession() as session:
+    started = time.perf_counter()
+    status_code = 'error'
+    telemetry.upstream_requests_in_flight.inc()
+    try:
+        body, status_code, validators = await client.get_body(url, headers=headers)
+        # The token was revoked or expired early: replay once with a new one
+        if status_code == 401:
+            headers['Authorization'] = f'Bearer {await oauth_tokens.invalidate(token)}'
+            body, status_code, validators = await client.get_body(url, headers=headers)
+    except aiohttp.ClientError as http_err:
+        logger.warning("HTTP error fetching %s: %s", url, http_err)
+        return json_codec.dumps({"error": str(http_err)}), 500
+    except Exception as err:
+        logger.exception("Error fetching %s", url)
+        return json_codec.dumps({"error": str(err)}), 500
+    finally:
+        elapsed = time.perf_counter() - started
+        telemetry.upstream_requests_in_flight.dec()
+        telemetry.upstream_request_duration.observe(elapsed, ttl_class=ttl_class(url), status=status_code)
+        profiler.add_io('upstream', elapsed)
+        logger.debug("GET %s -> %s in %.0f ms", url, status_code, elapsed * 1000)
+
+    timeout = ttl_for(url) + STALE_TTL
+    if status_code == 304 and cached is not None:
+        # Unchanged: keep the stored body, only renew its freshness
+        validators = {key: value or meta.get(key) for key, value in validators.items()}
+        await cache_set(f"meta:{url}", dict(validators, fetched_at=time.time()), timeout=timeout)
+        return cached
+    if status_code == 200:
+        await cache_set(f"body:{url}", (body, status_code), timeout=timeout)
+        await cache_set(f"meta:{url}", dict(validators, fetched_at=time.time()), timeout=timeout)
+    else:
+        # Error pages are not always JSON; callers always get a JSON body
         try:
-            async with session.get(url, headers=headers) as response:
-                print(f"Fetching data from {url}")
-                print(f"Response status code: {response.status}")
-                response_data = await response.json()
-                return response_data, response.status
-        except aiohttp.ClientError as http_err:
-            print(f"HTTP error occurred: {http_err}")
-            return {"error": str(http_err)}, 500
-        except Exception as err:
-            print(f"Other error occurred: {err}")
-            return {"error": str(err)}, 500
+            json_codec.loads(body)
+        except ValueError:
+            body = json_codec.dumps({"error": body.decode(errors='replace')})
+    return body, status_code
+
+# Serve an upstream JSON document as is: the cached bytes are passed through
+# without being parsed and serialised again. 'error' replaces the upstream
+# body of a failed request.
+async def proxy_json(url, error=None):
+    body, status_code = await fetch_body(url)
+    if status_code != 200 and error:
+        return jsonify({"error": error}), status_code
+    return app.response_class(body, status=status_code, mimetype='application/json')
+
+# Static game data (acts, artisans, item types, hero classes and skills),
+# preloaded per locale and served from memory
+static_catalog = CatalogStore(
+    fetch_data,
+    lambda path, locale: api_url(CATALOG_REGION, path, locale=locale),
+    CATALOG_DIR,
+    TTL_CLASSES['static'],
+    locales=set(LOCALES) | set(CATALOG_LOCALES),
+)
+for catalog_locale in CATALOG_LOCALES:
+    static_catalog.load(catalog_locale)
+
+# Serve static game data from the catalog of the locale. Until that catalog
+# is loaded, for a slug it does not know, or for a locale that gets no catalog,
+# fallback() asks the upstream API.
+async def serve_static(locale, lookup, fallback):
+    catalog = static_catalog.get(locale)
+    data = lookup(catalog) if catalog is not None else None
+    if data is not None:
+        return jsonify(data)
+    return await fallback()
+
+# Bad request arguments (e.g. unknown regions) are a client error, not an
+# upstream failure
+@app.errorhandler(InvalidRequest)
+def handle_invalid_request(err):
+    return jsonify({"error": str(err)}), 400
+
+# Resource class (see response_cache.TTL_CLASSES) of each API route, which
+# sets how long browsers may reuse its responses; unlisted routes use 'default'
+ROUTE_CACHE_CLASSES = {
+    'get_seasons': 'season',
+    'get_leaderboard': 'leaderboard',
+    'get_leaderboard_all': 'leaderboard',
+    'get_rift_details': 'leaderboard',
+    'get_most_used_items': 'leaderboard',
+    'get_item': 'static',
+    'get_act_index': 'static',
+    'get_artisan': 'static',
+    'get_hero_class': 'static',
+    'get_skill': 'static',
+    'get_class_skills': 'static',
+    'get_item_types': 'static',
+    'get_item_type': 'static',
+    'api_character': 'profile',
+    'get_character_full': 'profile',
+    'get_hero': 'profile',
+    'get_hero_items': 'profile',
+    'get_follower_items': 'profile',
+    'get_account_profile': 'profile',
+    'get_account_achievements': 'profile',
+}
+
+# HTTP caching for successful API reads: a strong ETag from the body (so an
+# unchanged document costs the client a 304), Cache-Control from the route's
+# resource class, and gzip/brotli compression. Compressed variants are kept in
+# the app cache under the body's hash, so each document is compressed once.
+@app.after_request
+def add_http_caching(response):
+    if (not request.path.startswith('/api/') or request.method not in ('GET', 'HEAD')
+            or response.status_code != 200 or response.direct_passthrough):
+        return response
+
+    cache_class = ROUTE_CACHE_CLASSES.get(request.endpoint, 'default')
+    response.cache_control.public = True
+    response.cache_control.max_age = TTL_CLASSES[cache_class]
+    response.vary.add('Accept-Encoding')
+
+    body = response.get_data()
+    etag = body_etag(body)
+    encoding = choose_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_SIZE else None
+    # Each encoding is its own representation, with its own strong ETag
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    response.make_conditional(request)
+    if response.status_code == 304 or encoding is None:
+        return response
+
+    key = f"encoded:{encoding}:{etag}"
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = compress(body, encoding)
+        cache.set(key, encoded, timeout=TTL_CLASSES[cache_class] + STALE_TTL)
+    response.set_data(encoded)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# Prometheus metrics of this process
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return app.response_class(telemetry.registry.render(), mimetype='text/plain; version=0.0.4')
 
 # Route to serve the home page
 @app.route('/')
@@ -75,121 +424,364 @@ def home():
 
 # Route to fetch seasons data
 @app.route('/api/seasons', methods=['GET'])
-def get_seasons():
-    region = request.args.get('region', default="us", type=str)
+async def get_seasons():
+    regions = parse_regions(request.args.get('region', default="us", type=str))
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/data/d3/season/?locale={locale}"
-    seasons_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify(seasons_data), status_code
-    
-    return jsonify(seasons_data)
+    if len(regions) == 1:
+        url = api_url(regions[0], "data/d3/season/", locale=locale)
+        return await proxy_json(url)
+
+    # Several regions: their season indexes side by side, fetched concurrently
+    results = await asyncio.gather(*(fetch_data(api_url(region, "data/d3/season/", locale=locale)) for region in regions))
+    seasons = {region: data for region, (data, status_code) in zip(regions, results) if status_code == 200}
+    errors = [region for region, (data, status_code) in zip(regions, results) if status_code != 200]
+    if not seasons:
+        return jsonify({"error": "Failed to fetch season data.", "failed": errors}), 502
+    return jsonify({"regions": seasons, "failed": errors})
 
 # Route to fetch leaderboard data by season and class
 @app.route('/api/leaderboard', methods=['GET'])
-def get_leaderboard():
+async def get_leaderboard():
     season_id = request.args.get('season_id', default=23, type=int)
     leaderboard_name = request.args.get('leaderboard_name', default="rift-barbarian", type=str)
-    region = request.args.get('region', default="us", type=str)
+    regions = parse_regions(request.args.get('region', default="us", type=str))
     locale = request.args.get('locale', default="en_US", type=str)
+    if not is_leaderboard_name(leaderboard_name):
+        return jsonify({"error": f"Invalid leaderboard name: {leaderboard_name}"}), 400
+
+    # Several regions (region=all or a list): one ranking of flat rows, each
+    # tagged with its region
+    if len(regions) > 1:
+        boards, errors = await fetch_region_leaderboards(season_id, [leaderboard_name], regions, locale)
+        if not boards:
+            return jsonify({"error": "Failed to fetch leaderboard data.", "failed": errors}), 502
+        result = leaderboard_page(merge_leaderboards(boards))
+        result.update({"season_id": season_id, "leaderboard_name": leaderboard_name, "regions": regions, "failed": errors})
+        return jsonify(result)
+    region = regions[0]
     
-    url = f"https://{region}.api.blizzard.com/data/d3/season/{season_id}/leaderboard/{leaderboard_name}?locale={locale}"
-    leaderboard_data, status_code = fetch_data(url)
-    
+    # format=flat returns compact rows with paging, filters and field selection
+    if request.args.get('format', default="raw", type=str) == "flat":
+        rows, status_code = await fetch_flat_leaderboard(season_id, leaderboard_name, region, locale)
+        if status_code != 200:
+            return jsonify({"error": "Failed to fetch leaderboard data."}), status_code
+        result = leaderboard_page(rows)
+        result.update({"season_id": season_id, "leaderboard_name": leaderboard_name, "region": region})
+        return jsonify(result)
+
+    url = api_url(region, f"data/d3/season/{season_id}/leaderboard/{leaderboard_name}", locale=locale)
+    return await proxy_json(url)
+
+# Apply the filter, paging and field selection query arguments to flat rows
+def leaderboard_page(rows):
+    rows = filter_rows(
+        rows,
+        min_rift_level=request.args.get('min_rift_level', type=int),
+        clan=request.args.get('clan', type=str),
+        battletag_prefix=request.args.get('battletag', type=str),
+    )
+    offset = max(request.args.get('offset', default=0, type=int), 0)
+    limit = min(max(request.args.get('limit', default=LEADERBOARD_DEFAULT_LIMIT, type=int), 0), LEADERBOARD_MAX_LIMIT)
+    page = paginate(rows, offset, limit)
+
+    fields = request.args.get('fields', type=str)
+    if fields:
+        page['rows'] = project(page['rows'], [field.strip() for field in fields.split(',') if field.strip()])
+    return page
+
+# Route to fetch the leaderboards of every class merged into one ranking
+@app.route('/api/leaderboard/all', methods=['GET'])
+async def get_leaderboard_all():
+    season_id = request.args.get('season_id', default=23, type=int)
+    regions = parse_regions(request.args.get('region', default="us", type=str))
+    locale = request.args.get('locale', default="en_US", type=str)
+
+    # Several regions (region=all or a list) are ranked together, rows tagged with their region
+    if len(regions) > 1:
+        boards, errors = await fetch_region_leaderboards(season_id, RIFT_LEADERBOARDS, regions, locale)
+        scope = {"regions": regions}
+    else:
+        boards, errors = await fetch_flat_leaderboards(season_id, RIFT_LEADERBOARDS, regions[0], locale)
+        boards = list(boards.values())
+        scope = {"region": regions[0]}
+    if not boards:
+        return jsonify({"error": "Failed to fetch leaderboard data.", "failed": errors}), 502
+
+    result = leaderboard_page(merge_leaderboards(boards))
+    result.update(scope, season_id=season_id, failed=errors)
+    return jsonify(result)
+
+# BattleTag -> leaderboard rows, fed by every flat leaderboard that gets loaded
+battletag_index = BattleTagIndex(max_age=LEADERBOARD_CACHE_TIMEOUT, max_boards=BATTLETAG_INDEX_MAX_BOARDS)
+
+# Fetch a leaderboard as flat rows, best first. The flattened rows are cached
+# alongside the raw payload so paging and filtering never re-flatten the board.
+async def fetch_flat_leaderboard(season_id, leaderboard_name, region, locale):
+    if not is_leaderboard_name(leaderboard_name):
+        return None, 400
+    url = api_url(region, f"data/d3/season/{season_id}/leaderboard/{leaderboard_name}", locale=locale)
+    rows = await cache_get(f"flat:{url}")
+    if rows is not None:
+        # Another worker may have flattened (or refreshed) it; make sure this
+        # process's index holds a current copy
+        age = battletag_index.board_age(region, season_id, leaderboard_name)
+        if age is None or age > LEADERBOARD_CACHE_TIMEOUT:
+            battletag_index.add_board(region, season_id, leaderboard_name, rows)
+        return rows, 200
+
+    # Leaderboards of finished seasons never change: serve them from a saved
+    # snapshot when there is one, without any upstream call. Snapshot files
+    # are read and written on the default executor, off the client loop.
+    loop = asyncio.get_running_loop()
+    rows = await loop.run_in_executor(None, snapshots.load_final_rows, region, season_id, leaderboard_name)
+    if rows is None:
+        data, status_code = await fetch_data(url)
+        if status_code != 200:
+            return None, status_code
+        rows = flatten_leaderboard(data, leaderboard_name)
+        if snapshots.available() and await is_past_season(season_id, region):
+            await loop.run_in_executor(
+                None, lambda: snapshots.write_snapshot(region, season_id, leaderboard_name, rows, final=True))
+    await cache_set(f"flat:{url}", rows, timeout=LEADERBOARD_CACHE_TIMEOUT)
+    battletag_index.add_board(region, season_id, leaderboard_name, rows)
+    return rows, 200
+
+# Whether a season is over, according to the (cached) season index
+async def is_past_season(season_id, region):
+    seasons_data, status_code = await fetch_data(api_url(region, "data/d3/season/", locale="en_US"))
     if status_code != 200:
-        return jsonify(leaderboard_data), status_code
-    
-    return jsonify(leaderboard_data)
+        return False
+    current_season = seasons_data.get('current_season') or len(seasons_data.get('season', []))
+    return season_id < current_season
+
+# Fetch and flatten several leaderboards of a season concurrently.
+# Returns the flat boards by name and the names of the boards that failed.
+async def fetch_flat_leaderboards(season_id, leaderboard_names, region, locale):
+    async def fetch_board(leaderboard_name):
+        rows, status_code = await fetch_flat_leaderboard(season_id, leaderboard_name, region, locale)
+        return rows if status_code == 200 else None
+
+    results = await asyncio.gather(*(fetch_board(name) for name in leaderboard_names))
+    boards = {name: rows for name, rows in zip(leaderboard_names, results) if rows is not None}
+    errors = [name for name, rows in zip(leaderboard_names, results) if rows is None]
+    return boards, errors
+
+# Fetch leaderboards of a season from several regions concurrently, as flat
+# rows tagged with their region. Returns the boards and the failed
+# '<region>/<leaderboard>' pairs.
+async def fetch_region_leaderboards(season_id, leaderboard_names, regions, locale):
+    results = await asyncio.gather(*(
+        fetch_flat_leaderboards(season_id, leaderboard_names, region, locale) for region in regions
+    ))
+    boards, errors = [], []
+    for region, (region_boards, region_errors) in zip(regions, results):
+        boards.extend(tag_region(rows, region) for rows in region_boards.values())
+        errors.extend(f"{region}/{name}" for name in region_errors)
+    return boards, errors
 
 # Route to fetch item details by item slug
 @app.route('/api/item/<string:item_slug>', methods=['GET'])
-def get_item(item_slug):
+async def get_item(item_slug):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/item/{item_slug}?locale={locale}"
-    item_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify(item_data), status_code
-    
-    return jsonify(item_data)
+    url = api_url(region, f"d3/data/item/{item_slug}", locale=locale)
+    return await proxy_json(url)
 
 # Route to fetch full profile data by account, including heroes, items, and follower items
 @app.route('/api/character/<string:account>', methods=['GET'])
-def api_character(account):
+async def api_character(account):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/?locale={locale}"
-    profile_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/profile/{account}/", locale=locale)
+    profile_data, status_code = await fetch_data(url)
     
     if status_code != 200:
         return jsonify({"error": "Failed to fetch profile data."}), status_code
 
-    heroes = profile_data.get('heroes', [])
-    detailed_heroes = []
-    for hero in heroes:
-        hero_id = hero.get('id')
-        if hero_id:
-            items_url = f"https://{region}.api.blizzard.com/d3/profile/{account}/hero/{hero_id}/items?locale={locale}"
-            items_data, _ = fetch_data(items_url)
-            hero['items'] = items_data.get('items', {})
-            detailed_heroes.append(hero)
+    heroes = [hero for hero in profile_data.get('heroes', []) if hero.get('id')]
+    detailed_heroes = await fetch_heroes_items(region, locale, account, heroes)
+    partial = any('error' in hero for hero in detailed_heroes)
     
-    return jsonify({"heroes": detailed_heroes})
+    return jsonify({"heroes": detailed_heroes, "partial": partial})
+
+# Fetch the items of every hero concurrently (bounded by HERO_FETCH_CONCURRENCY).
+# A hero whose fetch fails is still returned, with an 'error' marker instead of items.
+async def fetch_heroes_items(region, locale, account, heroes):
+    semaphore = asyncio.Semaphore(HERO_FETCH_CONCURRENCY)
+
+    async def fetch_hero_items(hero):
+        hero = dict(hero)
+        items_url = api_url(region, f"d3/profile/{account}/hero/{hero['id']}/items", locale=locale)
+        try:
+            async with semaphore:
+                items_data, status_code = await fetch_data(items_url)
+        except Exception as err:
+            items_data, status_code = {"error": str(err)}, 500
+        if status_code != 200:
+            hero['error'] = {"status": status_code, "message": "Failed to fetch hero items."}
+        else:
+            hero['items'] = items_data.get('items', {})
+        return hero
+
+    return await asyncio.gather(*(fetch_hero_items(hero) for hero in heroes))
 
 
 # Route to fetch detailed hero profile
 @app.route('/api/character/<string:account>/hero/<int:hero_id>', methods=['GET'])
-def get_hero(account, hero_id):
+async def get_hero(account, hero_id):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/hero/{hero_id}/?locale={locale}"
-    hero_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify(hero_data), status_code
-    
-    return jsonify(hero_data)
+    url = api_url(region, f"d3/profile/{account}/hero/{hero_id}/", locale=locale)
+    return await proxy_json(url)
 
 # Route to fetch items for a specific hero
 @app.route('/api/character/<string:account>/hero/<int:hero_id>/items', methods=['GET'])
-def get_hero_items(account, hero_id):
+async def get_hero_items(account, hero_id):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/hero/{hero_id}/items?locale={locale}"
-    items_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify({"error": "Failed to fetch hero items."}), status_code
-    
-    return jsonify(items_data)
+    url = api_url(region, f"d3/profile/{account}/hero/{hero_id}/items", locale=locale)
+    return await proxy_json(url, error="Failed to fetch hero items.")
 
 # Route to fetch follower items for a specific hero
 @app.route('/api/character/<string:account>/hero/<int:hero_id>/follower-items', methods=['GET'])
-def get_follower_items(account, hero_id):
+async def get_follower_items(account, hero_id):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/hero/{hero_id}/follower-items?locale={locale}"
-    follower_items_data, status_code = fetch_data(url)
-    
+    url = api_url(region, f"d3/profile/{account}/hero/{hero_id}/follower-items", locale=locale)
+    return await proxy_json(url, error="Failed to fetch follower items.")
+
+# Profile endpoints available per hero through the batch route
+HERO_PARTS = {
+    'hero': "d3/profile/{account}/hero/{hero_id}/",
+    'items': "d3/profile/{account}/hero/{hero_id}/items",
+    'follower-items': "d3/profile/{account}/hero/{hero_id}/follower-items",
+}
+
+# Fields the composite character route can return
+CHARACTER_FIELDS = {'profile', 'achievements', *HERO_PARTS}
+
+# Route to fetch many heroes in one call. The body is a list of
+# {"account", "hero_id", "parts"} objects (or {"heroes": [...]}), where parts
+# is a subset of HERO_PARTS (all of them when omitted). Results come back in
+# request order, with per-part errors instead of failing the whole batch.
+# The body is read and validated in the request thread, not on the client loop.
+@app.route('/api/heroes/batch', methods=['POST'])
+def get_heroes_batch():
+    region = request.args.get('region', default="us", type=str)
+    locale = request.args.get('locale', default="en_US", type=str)
+    body = request.get_json(silent=True)
+    entries = body.get('heroes') if isinstance(body, dict) else body
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "Expected a non-empty list of heroes."}), 400
+    if len(entries) > HERO_BATCH_MAX:
+        return jsonify({"error": f"At most {HERO_BATCH_MAX} heroes per batch."}), 400
+    for entry in entries:
+        # bool is an int subclass, so hero_id is checked by exact type
+        if (not isinstance(entry, dict) or not isinstance(entry.get('account'), str) or not entry['account']
+                or type(entry.get('hero_id')) is not int):
+            return jsonify({"error": "Each hero needs an 'account' and an integer 'hero_id'."}), 400
+        # The account becomes an upstream path segment
+        account = entry['account'].replace('#', '-')
+        if any(char in account for char in '/?#\\') or '..' in account:
+            return jsonify({"error": f"Invalid account: {entry['account']}"}), 400
+        parts = entry.get('parts')
+        if parts is not None and (not isinstance(parts, list) or not all(isinstance(part, str) for part in parts)):
+            return jsonify({"error": "'parts' must be a list of part names."}), 400
+        unknown = set(parts or ()) - set(HERO_PARTS)
+        if unknown:
+            return jsonify({"error": f"Unknown parts: {', '.join(sorted(unknown))}"}), 400
+
+    return client.run(fetch_heroes_batch(region, locale, entries))
+
+async def fetch_heroes_batch(region, locale, entries):
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch_hero(entry):
+        account = entry['account'].replace('#', '-')
+        parts = entry.get('parts') or list(HERO_PARTS)
+        result = {"account": account, "hero_id": entry['hero_id']}
+        result.update(await fetch_hero_parts(region, locale, account, entry['hero_id'], parts, semaphore))
+        return result
+
+    results = await asyncio.gather(*(fetch_hero(entry) for entry in entries))
+    return jsonify({"results": results})
+
+# Fetch the given HERO_PARTS of one hero concurrently. Returns {part: data},
+# plus {'errors': {part: status}} for the parts that failed.
+async def fetch_hero_parts(region, locale, account, hero_id, parts, semaphore):
+    async def fetch_part(part):
+        url = api_url(region, HERO_PARTS[part].format(account=account, hero_id=hero_id), locale=locale)
+        async with semaphore:
+            return await fetch_data(url)
+
+    responses = await asyncio.gather(*(fetch_part(part) for part in parts))
+    result = {}
+    for part, (data, status_code) in zip(parts, responses):
+        if status_code == 200:
+            result[part] = data
+        else:
+            result.setdefault('errors', {})[part] = status_code
+    return result
+
+# Route to fetch a whole character page in one call: the profile is fetched
+# once, then the requested per-hero parts and achievements concurrently.
+# fields= selects from CHARACTER_FIELDS; the hero list is always included.
+@app.route('/api/character/<string:account>/full', methods=['GET'])
+async def get_character_full(account):
+    region = request.args.get('region', default="us", type=str)
+    locale = request.args.get('locale', default="en_US", type=str)
+    fields = request.args.get('fields', default="profile,items", type=str)
+    fields = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = fields - CHARACTER_FIELDS
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+    url = api_url(region, f"d3/profile/{account}/", locale=locale)
+    profile_data, status_code = await fetch_data(url)
     if status_code != 200:
-        return jsonify({"error": "Failed to fetch follower items."}), status_code
-    
-    return jsonify(follower_items_data)
+        return jsonify({"error": "Failed to fetch profile data."}), status_code
+
+    semaphore = asyncio.Semaphore(HERO_FETCH_CONCURRENCY)
+    hero_parts = [part for part in HERO_PARTS if part in fields]
+    heroes = [hero for hero in profile_data.get('heroes', []) if hero.get('id')]
+
+    async def fetch_hero(hero):
+        hero = dict(hero)
+        if hero_parts:
+            hero.update(await fetch_hero_parts(region, locale, account, hero['id'], hero_parts, semaphore))
+        return hero
+
+    async def fetch_achievements():
+        if 'achievements' not in fields:
+            return None
+        achievements_url = api_url(region, f"d3/profile/{account}/achievements", locale=locale)
+        async with semaphore:
+            return await fetch_data(achievements_url)
+
+    detailed_heroes, achievements = await asyncio.gather(
+        asyncio.gather(*(fetch_hero(hero) for hero in heroes)),
+        fetch_achievements(),
+    )
+
+    result = {"heroes": detailed_heroes}
+    if 'profile' in fields:
+        result['profile'] = {key: value for key, value in profile_data.items() if key != 'heroes'}
+    if achievements is not None:
+        achievements_data, achievements_status = achievements
+        if achievements_status == 200:
+            result['achievements'] = achievements_data
+        else:
+            result['errors'] = {"achievements": achievements_status}
+    return jsonify(result)
 
 # Route to fetch account profile data (optional)
 @app.route('/api/account/<string:account>', methods=['GET'])
-def get_account_profile(account):
+async def get_account_profile(account):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/?locale={locale}"
-    profile_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify(profile_data), status_code
-    
-    return jsonify(profile_data)
+    url = api_url(region, f"d3/profile/{account}/", locale=locale)
+    return await proxy_json(url)
 
 @app.route('/character/<string:account>', methods=['GET'])
 def character_page(account):
@@ -201,46 +793,45 @@ def character_page(account):
 
 # Route to fetch rift details
 @app.route('/api/leaderboard_rift/<string:battletag>', methods=['GET'])
-def get_rift_details(battletag):
+async def get_rift_details(battletag):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
     
-    # Replace '#' with '-' to conform to API expectations
-    account = battletag.replace('#', '-')
-    
-    # Assuming 'rift-barbarian' as the default leaderboard name for rift details
     season_id = request.args.get('season_id', default=23, type=int)
-    leaderboard_name = "rift-barbarian"
-    
-    url = f"https://{region}.api.blizzard.com/data/d3/season/{season_id}/leaderboard/{leaderboard_name}?locale={locale}"
-    rift_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify({"error": "Failed to fetch rift details."}), status_code
-    
-    return jsonify(rift_data)
+
+    # Only load the class leaderboards the index does not hold a fresh copy of;
+    # once they are indexed the lookup itself is a dictionary access
+    ages = {name: battletag_index.board_age(region, season_id, name) for name in RIFT_LEADERBOARDS}
+    stale_boards = [name for name, age in ages.items() if age is None or age > LEADERBOARD_CACHE_TIMEOUT]
+    errors = []
+    if stale_boards:
+        boards, errors = await fetch_flat_leaderboards(season_id, stale_boards, region, locale)
+        if not boards and len(errors) == len(RIFT_LEADERBOARDS):
+            return jsonify({"error": "Failed to fetch rift details."}), 502
+
+    rows = battletag_index.lookup(region, season_id, battletag)
+    if not rows:
+        return jsonify({"error": "Player not found on the rift leaderboards.", "failed": errors}), 404
+
+    return jsonify({"battleTag": rows[0]['battleTag'], "season_id": season_id, "region": region, "rows": rows, "failed": errors})
+
 # Route to fetch account achievements data
 @app.route('/api/account/<string:account>/achievements', methods=['GET'])
-def get_account_achievements(account):
+async def get_account_achievements(account):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/achievements?locale={locale}"
-    achievements_data, status_code = fetch_data(url)
-    
-    if status_code != 200:
-        return jsonify({"error": "Failed to fetch achievements."}), status_code
-    
-    return jsonify(achievements_data)
+    url = api_url(region, f"d3/profile/{account}/achievements", locale=locale)
+    return await proxy_json(url, error="Failed to fetch achievements.")
 
 
 @app.route('/character/<string:account>/item/<string:item_id>', methods=['GET'])
-def item_page(account, item_id):
+async def item_page(account, item_id):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
     
     # Fetch the item details from the API
-    url = f"https://{region}.api.blizzard.com/d3/data/item/{item_id}?locale={locale}"
-    item_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/data/item/{item_id}", locale=locale)
+    item_data, status_code = await fetch_data(url)
     
     if status_code != 200:
         return render_template('error.html', message='Item not found'), status_code
@@ -249,13 +840,13 @@ def item_page(account, item_id):
     return render_template('item.html', account=account, item=item_data)
 
 @app.route('/character/<string:account>/hero/<int:hero_id>/items', methods=['GET'])
-def hero_items_page(account, hero_id):
+async def hero_items_page(account, hero_id):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
 
     # Fetch hero's items
-    url = f"https://{region}.api.blizzard.com/d3/profile/{account}/hero/{hero_id}/items?locale={locale}"
-    items_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/profile/{account}/hero/{hero_id}/items", locale=locale)
+    items_data, status_code = await fetch_data(url)
 
     if status_code != 200:
         return render_template('error.html', message="Unable to retrieve hero's items"), status_code
@@ -265,100 +856,79 @@ def hero_items_page(account, hero_id):
 
 # Route to fetch acts data
 @app.route('/api/acts', methods=['GET'])
-def get_act_index():
+async def get_act_index():
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/act?locale={locale}"
-    act_data, status_code = fetch_data(url)
-
-    if status_code != 200:
-        return jsonify(act_data), status_code
-
-    return jsonify(act_data)
+    url = api_url(region, "d3/data/act", locale=locale)
+    return await serve_static(locale, lambda catalog: catalog.acts(), lambda: proxy_json(url))
 
 
 # Route to fetch artisan data
 @app.route('/api/artisan/<string:artisan_slug>', methods=['GET'])
-def get_artisan(artisan_slug):
+async def get_artisan(artisan_slug):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/artisan/{artisan_slug}?locale={locale}"
-    artisan_data, status_code = fetch_data(url)
-
-    if status_code != 200:
-        return jsonify(artisan_data), status_code
-
-    return jsonify(artisan_data)
+    url = api_url(region, f"d3/data/artisan/{artisan_slug}", locale=locale)
+    return await serve_static(locale, lambda catalog: catalog.artisan(artisan_slug), lambda: proxy_json(url))
 
 @app.route('/classes')
 def classes():
     return render_template('classes.html')
 # Route to fetch hero class data by slug
 @app.route('/api/hero-class/<string:class_slug>', methods=['GET'])
-def get_hero_class(class_slug):
+async def get_hero_class(class_slug):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/hero/{class_slug}?locale={locale}"
-    hero_class_data, status_code = fetch_data(url)
-
-    if status_code != 200:
-        return jsonify(hero_class_data), status_code
-
-    return jsonify(hero_class_data)
+    url = api_url(region, f"d3/data/hero/{class_slug}", locale=locale)
+    return await serve_static(locale, lambda catalog: catalog.hero_class(class_slug), lambda: proxy_json(url))
 
 # Route to fetch skill data by hero class and skill slug
 @app.route('/api/hero-class/<string:class_slug>/skill/<string:skill_slug>', methods=['GET'])
-def get_skill(class_slug, skill_slug):
+async def get_skill(class_slug, skill_slug):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/hero/{class_slug}/skill/{skill_slug}?locale={locale}"
-    skill_data, status_code = fetch_data(url)
-
-    if status_code != 200:
-        return jsonify(skill_data), status_code
-
-    return jsonify(skill_data)
+    url = api_url(region, f"d3/data/hero/{class_slug}/skill/{skill_slug}", locale=locale)
+    return await serve_static(locale, lambda catalog: catalog.skill(class_slug, skill_slug), lambda: proxy_json(url))
 
 # Route to fetch all item types
 @app.route('/api/item-types', methods=['GET'])
-def get_item_types():
+async def get_item_types():
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/item-type?locale={locale}"
-    item_types_data, status_code = fetch_data(url)
-
-    if status_code != 200:
-        return jsonify(item_types_data), status_code
-
-    return jsonify(item_types_data)
+    url = api_url(region, "d3/data/item-type", locale=locale)
+    return await serve_static(locale, lambda catalog: catalog.item_types(), lambda: proxy_json(url))
 
 
+# Route to fetch an item type (by slug or id) with the items of that type
 @app.route('/api/item-type/<string:item_type>', methods=['GET'])
-def get_item_type(item_type):
-    item_types = {
-        "craftingplansmith": {"name": "Blacksmith Plan", "description": "A crafting plan used by the blacksmith."},
-        "bootsbarbarian": {"name": "Barbarian Boots", "description": "Boots for a barbarian."},
-        # Add more item types here...
-    }
-
-    if item_type in item_types:
-        return jsonify(item_types[item_type])
-    else:
+async def get_item_type(item_type):
+    locale = request.args.get('locale', default="en_US", type=str)
+    if not static_catalog.supports(locale):
+        return jsonify({"error": f"Unsupported locale: {locale}"}), 400
+    catalog = static_catalog.get(locale)
+    if catalog is None:
+        return jsonify({"error": "Game data is still loading, try again shortly."}), 503
+
+    item_type_data = catalog.item_type(item_type)
+    if item_type_data is None:
         return jsonify({"error": "Item type not found"}), 404
+    return jsonify(item_type_data)
 
 
+# Route to fetch the active and passive skills of a hero class
 @app.route('/api/hero-class/<string:class_slug>/skills', methods=['GET'])
-def get_class_skills(class_slug):
+async def get_class_skills(class_slug):
     region = request.args.get('region', default="us", type=str)
     locale = request.args.get('locale', default="en_US", type=str)
-    url = f"https://{region}.api.blizzard.com/d3/data/hero/{class_slug}/skills?locale={locale}"
-    
-    skills_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/data/hero/{class_slug}", locale=locale)
 
-    if status_code != 200:
-        return jsonify({"error": "Failed to fetch skills data"}), status_code
+    async def from_upstream():
+        hero_class_data, status_code = await fetch_data(url)
+        if status_code != 200:
+            return jsonify({"error": "Failed to fetch skills data"}), status_code
+        return jsonify(hero_class_data.get('skills', {}))
 
-    return jsonify(skills_data)
+    return await serve_static(locale, lambda catalog: catalog.class_skills(class_slug), from_upstream)
 
 
     
@@ -367,105 +937,159 @@ def most_used_page():
     return render_template('most_used.html')
 
 
-import random
-
 @app.route('/api/most_used_items', methods=['GET'])
-def get_most_used_items():
+async def get_most_used_items():
     season_id = request.args.get('season_id', default=23, type=int)
     class_slug = request.args.get('class_slug', default='rift-monk', type=str)
+    top = request.args.get('top', default=MOST_USED_DEFAULT_TOP, type=int)
+    top = max(1, min(top, MOST_USED_MAX_TOP))
+    if class_slug not in RIFT_LEADERBOARDS:
+        return jsonify({'error': f"Unknown class_slug: {class_slug}"}), 400
 
-    print(f"Fetching most used items for Season {season_id}, Class: {class_slug}")
+    # Served from the precomputed aggregates; only the very first request for a
+    # season/class/top combination waits for the computation
+    try:
+        entry = await most_used_aggregates.get((season_id, class_slug, top))
+    except AggregateError as err:
+        return jsonify({'error': str(err)}), err.status_code
 
-    # Fetch leaderboard data for the given class and season from Blizzard API
-    url = f"https://us.api.blizzard.com/data/d3/season/{season_id}/leaderboard/{class_slug}?locale=en_US"
-    leaderboard_data, status_code = fetch_data(url)  # Removed await
-
-    if status_code != 200:
-        print(f"Error fetching leaderboard: {leaderboard_data}")
-        return jsonify({'error': 'Failed to fetch leaderboard data'}), status_code
+    entry.pop('computed_ts', None)
+    return jsonify(entry)
 
-    # Get top 15 players from the leaderboard
-    rows = leaderboard_data.get('row', [])[:15]  # Fetch top 15 players
+# Build the most used items aggregate for one season and leaderboard class
+async def compute_most_used_items(season_id, class_slug, top):
+    logger.info("Computing most used items for season %s, class %s, top %s", season_id, class_slug, top)
 
-    item_occurrences = {}
+    # Fetch leaderboard data for the given class and season from Blizzard API
+    url = api_url("us", f"data/d3/season/{season_id}/leaderboard/{class_slug}", locale="en_US")
+    leaderboard_data, status_code = await fetch_data(url)
 
-    for row in rows:
-        battle_tag = row.get('player', [{}])[0].get('data', [{}])[0].get('string')
-        print(f"Processing BattleTag: {battle_tag}")
-        if battle_tag:
-            # Fetch character data using the battle_tag from the Blizzard API
-            character_data = get_character_data(battle_tag)
-            if 'heroes' not in character_data:
-                continue  # Skip if no heroes data available
-
-            # Process heroes for the selected class
-            for hero in character_data['heroes']:
-                if hero.get('classSlug') == class_slug.split('-')[-1]:  # Match class from the slug
-                    print(f"Fetching items for hero: {hero.get('name')} (Class: {hero.get('classSlug')})")
-
-                    # Fetch hero items using the hero ID
-                    hero_id = hero.get('id')
-                    hero_items = get_hero_items(battle_tag, hero_id)
-
-                    # Log the hero_items response for debugging
-                    print(f"Items for hero {hero.get('name')}: {hero_items}")
-
-                    # Ensure we correctly access the items data
-                    if hero_items:
-                        for slot, item in hero_items.items():
-                            item_name = item.get('name')
-                            if item_name:
-                                if slot not in item_occurrences:
-                                    item_occurrences[slot] = {}
-                                if item_name not in item_occurrences[slot]:
-                                    item_occurrences[slot][item_name] = {
-                                        "item": item,
-                                        "count": 0
-                                    }
-                                item_occurrences[slot][item_name]["count"] += 1  # Count the occurrence of the item
-                    else:
-                        print(f"No items found for hero {hero.get('name')}.")
-    
-    # Find the most used item for each slot
-    most_used_items = {
-        slot: max(items.values(), key=lambda x: x['count'])
+    if status_code != 200:
+        logger.warning("Failed to fetch leaderboard %s: %s", url, status_code)
+        raise AggregateError('Failed to fetch leaderboard data', status_code)
+
+    # Get the top N players from the leaderboard
+    rows = leaderboard_data.get('row', [])[:top]
+    battle_tags = [row.get('player', [{}])[0].get('data', [{}])[0].get('string') for row in rows]
+
+    item_occurrences, most_used_items = await collect_item_occurrences([tag for tag in battle_tags if tag], class_slug)
+
+    # Full popularity per slot, most used first
+    slot_counts = {
+        slot: sorted(
+            ({"name": name, "count": entry["count"]} for name, entry in items.items()),
+            key=lambda x: x['count'],
+            reverse=True,
+        )
         for slot, items in item_occurrences.items()
     }
 
-    print(f"Most used items: {most_used_items}")
-    return jsonify(most_used_items)
+    return {
+        "season_id": season_id,
+        "class_slug": class_slug,
+        "top": top,
+        "items": most_used_items,
+        "counts": slot_counts,
+    }
+
+most_used_aggregates = AggregateStore(
+    cache, compute_most_used_items, 'most_used_items', MOST_USED_MAX_AGE, key_ttl=MOST_USED_KEY_TTL,
+    executor=cache_executor)
+
+# Hero classSlug for the leaderboards whose name is not simply 'rift-<classSlug>'
+LEADERBOARD_HERO_CLASSES = {
+    'rift-dh': 'demon-hunter',
+    'rift-wd': 'witch-doctor',
+}
+
+# Fetch every matching hero's items for the given players and tally them per slot.
+# Profile and item fetches share one semaphore so the two stages overlap; each
+# hero's items are tallied as soon as they arrive, tracking the leader per slot
+# on the way so no second pass over the counts is needed.
+async def collect_item_occurrences(battle_tags, class_slug, region="us", locale="en_US"):
+    semaphore = asyncio.Semaphore(MOST_USED_CONCURRENCY)
+    hero_class = LEADERBOARD_HERO_CLASSES.get(class_slug, class_slug.split('-')[-1])
+    item_occurrences = {}
+    most_used_items = {}
+
+    def tally(hero_items):
+        for slot, item in hero_items.items():
+            item_name = item.get('name') if isinstance(item, dict) else None
+            if not item_name:
+                continue
+            slot_items = item_occurrences.setdefault(slot, {})
+            entry = slot_items.setdefault(item_name, {"item": item, "count": 0})
+            entry["count"] += 1  # Count the occurrence of the item
+            if slot not in most_used_items or entry["count"] > most_used_items[slot]["count"]:
+                most_used_items[slot] = entry
+
+    async def process_hero(battle_tag, hero_id):
+        async with semaphore:
+            hero_items = await fetch_player_hero_items(battle_tag, hero_id, region, locale)
+        tally(hero_items)
+
+    async def process_player(battle_tag):
+        async with semaphore:
+            character_data = await fetch_character_data(battle_tag, region, locale)
+        heroes = [hero for hero in character_data.get('heroes', []) if hero.get('classSlug') == hero_class]
+        await asyncio.gather(*(process_hero(battle_tag, hero.get('id')) for hero in heroes))
+
+    await asyncio.gather(*(process_player(battle_tag) for battle_tag in battle_tags))
+    return item_occurrences, most_used_items
 
 # Fetch hero items using Blizzard API
-def get_hero_items(battle_tag, hero_id):
-    region = "us"
-    locale = "en_US"
+async def fetch_player_hero_items(battle_tag, hero_id, region="us", locale="en_US"):
     battle_tag_formatted = battle_tag.replace("#", "-")  # Replace '#' with '-' for API compatibility
-    url = f"https://{region}.api.blizzard.com/d3/profile/{battle_tag_formatted}/hero/{hero_id}/items?locale={locale}"
-    hero_items_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/profile/{battle_tag_formatted}/hero/{hero_id}/items", locale=locale)
+    hero_items_data, status_code = await fetch_data(url)
 
     if status_code != 200:
-        print(f"Error fetching hero items for {battle_tag}, Hero ID: {hero_id}")
+        logger.warning("Failed to fetch hero items for %s, hero %s: %s", battle_tag, hero_id, status_code)
         return {}
     
     return hero_items_data
 
 # Fetch character data using Blizzard API
-def get_character_data(battle_tag):
-    region = "us"
-    locale = "en_US"
+async def fetch_character_data(battle_tag, region="us", locale="en_US"):
     battle_tag_formatted = battle_tag.replace("#", "-")  # Replace '#' with '-' for API compatibility
-    url = f"https://{region}.api.blizzard.com/d3/profile/{battle_tag_formatted}/?locale={locale}"
-    character_data, status_code = fetch_data(url)
+    url = api_url(region, f"d3/profile/{battle_tag_formatted}/", locale=locale)
+    character_data, status_code = await fetch_data(url)
 
     if status_code != 200:
-        print(f"Error fetching character data for {battle_tag}")
+        logger.warning("Failed to fetch character data for %s: %s", battle_tag, status_code)
         return {}
     
     return character_data
 
 
+# Background jobs of the API server: OAuth token renewal and the catalog and
+# most used items refreshes. They start with the first request served (or
+# with python app.py), so that importing this module, e.g. from crawler.py,
+# starts none of them.
+background_jobs_lock = threading.Lock()
+background_jobs_started = False
+
+def start_background_jobs():
+    global background_jobs_started
+    with background_jobs_lock:
+        if background_jobs_started:
+            return
+        background_jobs_started = True
+    if CLIENT_ID and CLIENT_SECRET:
+        client.submit(with_priority(BACKGROUND, oauth_tokens.run_periodic()))
+    if CATALOG_REFRESH_INTERVAL > 0:
+        client.submit(with_priority(BACKGROUND, static_catalog.run_periodic(CATALOG_LOCALES, CATALOG_REFRESH_INTERVAL)))
+    if MOST_USED_REFRESH_INTERVAL > 0:
+        client.submit(with_priority(BACKGROUND, most_used_aggregates.run_periodic(MOST_USED_REFRESH_INTERVAL)))
+
+@app.before_request
+def ensure_background_jobs():
+    if not background_jobs_started:
+        start_background_jobs()
+
 # Start Flask app
 if __name__ == '__main__':
+    start_background_jobs()
     app.run(debug=True)
 
 
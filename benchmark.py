@@ -0,0 +1,138 @@
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+
+import aiohttp
+
+# Load test for a running app, normally pointed at mock_blizzard.py so that
+# upstream calls can be counted:
+#
+#   python mock_blizzard.py &
+#   BLIZZARD_API_BASE_URL=http://127.0.0.1:8081/{region} \
+#   BLIZZARD_AUTH_URL=http://127.0.0.1:8081/token python app.py &
+#   python benchmark.py --concurrency 32 --requests 500
+#
+# Each scenario sends its requests with the given concurrency and reports
+# latency percentiles, throughput and the upstream calls it caused (read from
+# the mock's /_stats). Restart the app with an empty CACHE_DIR to measure a
+# cold cache.
+
+CLASSES = ['rift-barbarian', 'rift-wizard', 'rift-dh', 'rift-monk', 'rift-necromancer', 'rift-wd', 'rift-crusader']
+ACCOUNTS = [f"Player{n}-{1000 + n}" for n in range(1, 51)]
+
+# Scenario name -> endless generator of request paths
+SCENARIOS = {
+    'leaderboard': lambda season: (
+        f"/api/leaderboard?season_id={season}&leaderboard_name={name}" for name in itertools.cycle(CLASSES)
+    ),
+    'leaderboard_flat': lambda season: (
+        f"/api/leaderboard?season_id={season}&leaderboard_name={name}&format=flat&limit=100"
+        for name in itertools.cycle(CLASSES)
+    ),
+    'character': lambda season: (
+        f"/api/character/{account}" for account in itertools.cycle(ACCOUNTS)
+    ),
+    'most_used_items': lambda season: (
+        f"/api/most_used_items?season_id={season}&class_slug={name}" for name in itertools.cycle(CLASSES)
+    ),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def upstream_stats(session, mock_url):
+    if not mock_url:
+        return {}
+    try:
+        async with session.get(f"{mock_url}/_stats") as response:
+            return await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return {}
+
+
+async def run_scenario(session, app_url, mock_url, paths, requests, concurrency):
+    latencies = []
+    errors = 0
+    queue = iter(itertools.islice(paths, requests))
+
+    async def worker():
+        nonlocal errors
+        for path in queue:
+            started = time.perf_counter()
+            try:
+                async with session.get(app_url + path) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    before = await upstream_stats(session, mock_url)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    after = await upstream_stats(session, mock_url)
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'upstream': after.get('total', 0) - before.get('total', 0) if after else None,
+        'tokens': after.get('token', 0) - before.get('token', 0) if after else None,
+    }
+
+
+async def run(args):
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        results = {}
+        for name in args.scenarios:
+            results[name] = await run_scenario(
+                session, args.app_url, args.mock_url, SCENARIOS[name](args.season),
+                args.requests, args.concurrency,
+            )
+        return results
+
+
+def print_results(results):
+    print(f"{'scenario':<18}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'upstream':>10}{'tokens':>8}")
+    for name, result in results.items():
+        upstream = '-' if result['upstream'] is None else result['upstream']
+        tokens = '-' if result['tokens'] is None else result['tokens']
+        print(
+            f"{name:<18}{result['requests']:>9}{result['errors']:>8}{result['rps']:>9.1f}"
+            f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}{upstream:>10}{tokens:>8}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API and report latency, throughput and upstream calls.")
+    parser.add_argument('--app-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--mock-url', default='http://127.0.0.1:8081', help="mock_blizzard.py, for upstream call counts ('' to skip)")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--season', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import os
+import asyncio
+import atexit
+import contextvars
+import threading
+from urllib.parse import quote, urlencode
+
+import aiohttp
+
+import json_codec
+from errors import InvalidRequest
+from telemetry import upstream_retries
+from ratelimit import RateLimiter, TokenBucket, backoff_delay, parse_retry_after
+
+# Regions served by the Blizzard API (each one is its own host)
+REGIONS = ('us', 'eu', 'kr', 'tw')
+
+# API root per region. Can point at a local stand-in such as mock_blizzard.py,
+# e.g. BLIZZARD_API_BASE_URL=http://127.0.0.1:8081/{region}
+API_BASE_URL = os.getenv('BLIZZARD_API_BASE_URL', 'https://{region}.api.blizzard.com')
+
+# Connection pool settings, overridable from the environment
+POOL_LIMIT = int(os.getenv('BLIZZARD_POOL_LIMIT', 100))
+POOL_LIMIT_PER_HOST = int(os.getenv('BLIZZARD_POOL_LIMIT_PER_HOST', 20))
+DNS_CACHE_TTL = int(os.getenv('BLIZZARD_DNS_CACHE_TTL', 300))
+KEEPALIVE_TIMEOUT = float(os.getenv('BLIZZARD_KEEPALIVE_TIMEOUT', 60))
+CONNECT_TIMEOUT = float(os.getenv('BLIZZARD_CONNECT_TIMEOUT', 5))
+TOTAL_TIMEOUT = float(os.getenv('BLIZZARD_TOTAL_TIMEOUT', 30))
+
+# Client-side quotas (Blizzard allows 100 requests/s and 36,000/hour per
+# client; these apply per process) and retry policy for idempotent GETs
+RATE_PER_SECOND = float(os.getenv('BLIZZARD_RATE_PER_SECOND', 100))
+RATE_PER_HOUR = float(os.getenv('BLIZZARD_RATE_PER_HOUR', 36000))
+MAX_RETRIES = int(os.getenv('BLIZZARD_MAX_RETRIES', 3))
+BACKOFF_BASE = float(os.getenv('BLIZZARD_BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.getenv('BLIZZARD_BACKOFF_MAX', 10))
+
+# Upstream statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Build a Blizzard API URL for the given region. Each path segment is
+# percent-quoted, so a value taken from a request (an account, a slug) cannot
+# add a query string or fragment, and '.'/'..' segments are refused so it
+# cannot climb to another resource either.
+def api_url(region, path, **params):
+    if region not in REGIONS:
+        raise InvalidRequest(f"Unknown region: {region}")
+    segments = path.lstrip('/').split('/')
+    if any(segment in ('.', '..') for segment in segments):
+        raise InvalidRequest(f"Invalid path: {path}")
+    path = '/'.join(quote(segment, safe="-_.~!$&'()*+,;=:@") for segment in segments)
+    url = f"{API_BASE_URL.format(region=region)}/{path}"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    return url
+
+
+# 'all', a comma separated list of regions, or a single region -> list of
+# regions, lowercased and checked against REGIONS
+def parse_regions(value):
+    value = value.strip().lower()
+    if value == 'all':
+        return list(REGIONS)
+    regions = list(dict.fromkeys(region.strip() for region in value.split(',') if region.strip()))
+    unknown = [region for region in regions if region not in REGIONS]
+    if unknown or not regions:
+        raise InvalidRequest(f"Unknown regions: {', '.join(unknown) or value}")
+    return regions
+
+
+# Process-wide HTTP client: one event loop in a background thread owning one
+# keep-alive connection pool, shared by every route and every region host.
+class BlizzardClient:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+        self.limiter = RateLimiter([
+            TokenBucket(RATE_PER_SECOND, RATE_PER_SECOND),
+            TokenBucket(RATE_PER_HOUR / 3600, RATE_PER_HOUR),
+        ])
+
+    @property
+    def loop(self):
+        self.start()
+        return self._loop
+
+    @property
+    def session(self):
+        self.start()
+        return self._session
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='blizzard-client', daemon=True)
+            thread.start()
+            self._session = asyncio.run_coroutine_threadsafe(self._create_session(), loop).result()
+            self._loop = loop
+            self._thread = thread
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    # Run a coroutine on the client loop and wait for its result. The caller's
+    # context variables (e.g. Flask's request context) are visible to it.
+    def run(self, coro, timeout=None):
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(_run_in_context(coro, context), self.loop).result(timeout)
+
+    # Schedule a coroutine on the client loop without waiting for it
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # GET a document as raw bytes. Returns (body, status, validators) where
+    # validators holds the ETag/Last-Modified headers; body is None for a 304.
+    # Every attempt waits for the rate limiter; 429s, 5xx and connection errors
+    # are retried with jittered backoff, honouring Retry-After.
+    async def get_body(self, url, headers=None):
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        upstream_retries.inc(reason=response.status)
+                        if response.status == 429:
+                            self.limiter.pause(retry_after or BACKOFF_BASE)
+                        await asyncio.sleep(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX, retry_after))
+                        continue
+                    validators = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+                    if response.status == 304:
+                        return None, response.status, validators
+                    return await response.read(), response.status, validators
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+                upstream_retries.inc(reason='connection')
+                await asyncio.sleep(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX))
+
+    # Same as get_body, with the body parsed as JSON
+    async def get_json(self, url, headers=None):
+        body, status, validators = await self.get_body(url, headers)
+        return (None if body is None else json_codec.loads(body)), status, validators
+
+    async def post_json(self, url, **kwargs):
+        async with self.session.post(url, **kwargs) as response:
+            if response.status != 200:
+                return {"error": await response.text()}, response.status
+            return json_codec.loads(await response.read()), response.status
+
+    # Cancel background jobs still running on the loop, then release the pool
+    async def _shutdown(self, session):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await session.close()
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            loop, thread, session = self._loop, self._thread, self._session
+            self._loop = self._thread = self._session = None
+        asyncio.run_coroutine_threadsafe(self._shutdown(session), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+# Coalesces concurrent calls for the same key: the first caller starts the
+# work and every caller arriving while it is in flight awaits the same result.
+# Must be used from a single event loop (the client loop).
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # A cancelled waiter must not cancel the shared call for the others
+        return await asyncio.shield(future)
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+async def _run_in_context(coro, context):
+    return await context.run(asyncio.ensure_future, coro)
+
+
+client = BlizzardClient()
+atexit.register(client.close)
@@ -0,0 +1,236 @@
+import os
+import re
+import time
+import asyncio
+import logging
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Static game data only changes with patches, so the whole of it is loaded
+# once per locale into memory (and saved to disk for the next start) and the
+# static data routes are answered from there.
+
+ARTISANS = ('blacksmith', 'jeweler', 'mystic')
+HERO_CLASSES = ('barbarian', 'crusader', 'demon-hunter', 'monk', 'necromancer', 'witch-doctor', 'wizard')
+
+# Locales served by the Blizzard API. Only these (and the configured ones)
+# get a catalog; the locale is part of the catalog's file name.
+LOCALES = (
+    'en_US', 'es_MX', 'pt_BR', 'en_GB', 'es_ES', 'fr_FR', 'ru_RU',
+    'de_DE', 'pt_PT', 'it_IT', 'pl_PL', 'ko_KR', 'zh_TW', 'zh_CN',
+)
+LOCALE_PATTERN = re.compile(r'^[a-z]{2}_[A-Z]{2}$')
+
+# Upstream fetches in flight while a catalog is built
+CATALOG_CONCURRENCY = int(os.getenv('CATALOG_CONCURRENCY', 16))
+# Seconds before a failed build is retried on demand
+CATALOG_RETRY_DELAY = int(os.getenv('CATALOG_RETRY_DELAY', 300))
+
+
+class CatalogError(Exception):
+    pass
+
+
+# Last path segment of a Blizzard game data link, e.g. 'item-type/amulet'
+def _slug(path):
+    return (path or '').rstrip('/').rsplit('/', 1)[-1].lower()
+
+
+# Download the static game data of one locale. 'fetch' is the app's
+# fetch_data(url) and 'url' builds the URL of a game data path. Any failed
+# fetch fails the whole build, so a partial catalog is never saved.
+async def build_catalog(fetch, url, locale):
+    semaphore = asyncio.Semaphore(CATALOG_CONCURRENCY)
+
+    async def get(path):
+        async with semaphore:
+            data, status_code = await fetch(url(path, locale))
+        if status_code != 200:
+            raise CatalogError(f"Failed to fetch {path} ({locale}): {status_code}")
+        return data
+
+    async def get_all(paths):
+        return await asyncio.gather(*(get(path) for path in paths))
+
+    acts, item_types, artisans, hero_classes = await asyncio.gather(
+        get("d3/data/act"),
+        get("d3/data/item-type"),
+        get_all(f"d3/data/artisan/{slug}" for slug in ARTISANS),
+        get_all(f"d3/data/hero/{slug}" for slug in HERO_CLASSES),
+    )
+    hero_classes = dict(zip(HERO_CLASSES, hero_classes))
+
+    item_type_slugs = sorted({_slug(entry.get('path')) for entry in item_types if entry.get('path')})
+    class_skills = [
+        (class_slug, skill['skill']['slug'])
+        for class_slug, hero_class in hero_classes.items()
+        for kind in ('active', 'passive')
+        for skill in hero_class.get('skills', {}).get(kind, [])
+        if skill.get('skill', {}).get('slug')
+    ]
+    item_type_items, skills = await asyncio.gather(
+        get_all(f"d3/data/item-type/{slug}" for slug in item_type_slugs),
+        get_all(f"d3/data/hero/{class_slug}/skill/{skill_slug}" for class_slug, skill_slug in class_skills),
+    )
+
+    skills_by_class = {}
+    for (class_slug, skill_slug), skill in zip(class_skills, skills):
+        skills_by_class.setdefault(class_slug, {})[skill_slug] = skill
+
+    return {
+        'locale': locale,
+        'built_at': time.time(),
+        'acts': acts,
+        'item_types': item_types,
+        'item_type_items': dict(zip(item_type_slugs, item_type_items)),
+        'artisans': dict(zip(ARTISANS, artisans)),
+        'hero_classes': hero_classes,
+        'skills': skills_by_class,
+    }
+
+
+# Read-only view over the static data of one locale
+class Catalog:
+    def __init__(self, data):
+        self.data = data
+        self.built_at = data['built_at']
+        # Item types are looked up by their link slug or, case-insensitively, by id
+        self._item_types = {}
+        for entry in data['item_types']:
+            self._item_types[_slug(entry.get('path'))] = entry
+            self._item_types.setdefault((entry.get('id') or '').lower(), entry)
+
+    def acts(self):
+        return self.data['acts']
+
+    def artisan(self, slug):
+        return self.data['artisans'].get(slug)
+
+    def item_types(self):
+        return self.data['item_types']
+
+    # An item type with the items of that type
+    def item_type(self, slug):
+        entry = self._item_types.get(slug.lower())
+        if entry is None:
+            return None
+        return dict(entry, items=self.data['item_type_items'].get(_slug(entry.get('path')), []))
+
+    def hero_class(self, slug):
+        return self.data['hero_classes'].get(slug)
+
+    # The active and passive skills of a class, as listed by the class
+    def class_skills(self, slug):
+        hero_class = self.hero_class(slug)
+        return None if hero_class is None else hero_class.get('skills', {})
+
+    def skill(self, class_slug, skill_slug):
+        return self.data['skills'].get(class_slug, {}).get(skill_slug)
+
+
+# Catalogs by locale. Each one is read from disk at startup when saved there,
+# and rebuilt in the background once older than max_age; a supported locale
+# asked for that is not loaded yet gets built in the background too (at most
+# once per CATALOG_RETRY_DELAY if its build fails). All async methods run on
+# the shared client loop; they read and write the catalog files on the
+# default executor, as these are several MB of JSON.
+class CatalogStore:
+    def __init__(self, fetch, url, directory, max_age, locales=LOCALES):
+        self._fetch = fetch
+        self._url = url
+        self._directory = directory
+        self.max_age = max_age
+        self._supported = set(locales)
+        self._catalogs = {}
+        self._building = {}
+        self._failed = {}  # locale -> time of the last failed build
+
+    def supports(self, locale):
+        return locale in self._supported and LOCALE_PATTERN.match(locale) is not None
+
+    def _path(self, locale):
+        if not self.supports(locale):
+            raise CatalogError(f"Unsupported locale: {locale!r}")
+        return os.path.join(self._directory, f"{locale}.json")
+
+    # Load the saved catalog of a locale, if any (and newer than the one held)
+    def load(self, locale):
+        return self._keep(locale, self._read(locale))
+
+    async def load_async(self, locale):
+        catalog = await asyncio.get_running_loop().run_in_executor(None, self._read, locale)
+        return self._keep(locale, catalog)
+
+    def _read(self, locale):
+        if not self.supports(locale):
+            return None
+        try:
+            with open(self._path(locale), 'rb') as f:
+                return Catalog(json_codec.loads(f.read()))
+        except FileNotFoundError:
+            return None
+
+    def _keep(self, locale, catalog):
+        if catalog is None:
+            return None
+        current = self._catalogs.get(locale)
+        if current is None or catalog.built_at > current.built_at:
+            self._catalogs[locale] = current = catalog
+        return current
+
+    def _save(self, locale, data):
+        os.makedirs(self._directory, exist_ok=True)
+        path = self._path(locale)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_codec.dumps(data))
+        os.replace(tmp_path, path)
+
+    # The catalog of a locale, or None (and a build starts) if it is not loaded.
+    # Unsupported locales never get one.
+    def get(self, locale):
+        catalog = self._catalogs.get(locale)
+        if catalog is None and self.supports(locale):
+            if time.time() - self._failed.get(locale, 0) >= CATALOG_RETRY_DELAY:
+                self.schedule(locale)
+        return catalog
+
+    def locales(self):
+        return list(self._catalogs)
+
+    def schedule(self, locale):
+        task = self._building.get(locale)
+        if task is None:
+            task = asyncio.ensure_future(self.build(locale))
+            self._building[locale] = task
+            task.add_done_callback(lambda _: self._building.pop(locale, None))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def build(self, locale):
+        try:
+            data = await build_catalog(self._fetch, self._url, locale)
+        except Exception:
+            self._failed[locale] = time.time()
+            raise
+        self._failed.pop(locale, None)
+        await asyncio.get_running_loop().run_in_executor(None, self._save, locale, data)
+        self._catalogs[locale] = catalog = Catalog(data)
+        return catalog
+
+    # Keep the given locales loaded and fresh, forever. A catalog saved by
+    # another worker in the meantime is picked up instead of rebuilt.
+    async def run_periodic(self, locales, interval):
+        while True:
+            for locale in set(locales) | set(self._catalogs):
+                if not self.supports(locale):
+                    continue
+                catalog = await self.load_async(locale)
+                if catalog is None or time.time() - catalog.built_at > self.max_age:
+                    try:
+                        await self.schedule(locale)
+                    except Exception as err:
+                        logger.warning("Failed to build the %s game data catalog: %s", locale, err)
+            await asyncio.sleep(interval)
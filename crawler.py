@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+# Warms the API cache (and the snapshot store) with every rift leaderboard of
+# every season and region, so users never pay for a cold leaderboard fetch.
+#
+#   python crawler.py                        # everything
+#   python crawler.py --regions us eu --seasons 28 29
+#
+# Boards are fetched concurrently through the same rate limiter as the API,
+# at background priority. Finished boards are recorded in a progress file, so
+# an interrupted crawl picks up where it stopped; the file is removed once a
+# crawl completes.
+#
+# Every board takes two cache entries (the raw payload and its flat rows), so a
+# full crawl needs several thousand entries and several GB of cache: far more
+# than the default CACHE_THRESHOLD/CACHE_MAX_BYTES, which would evict most of
+# it again. Raise both before crawling everything, or crawl a subset.
+
+from app import cache, fetch_data, fetch_flat_leaderboard, is_past_season
+from blizzard_client import client, api_url, REGIONS
+from ratelimit import BACKGROUND, with_priority
+from leaderboards import RIFT_LEADERBOARDS
+import snapshots
+
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 16))
+PROGRESS_FILE = os.path.join(cache.config['CACHE_DIR'] or '.cache', 'crawl-progress.json')
+
+
+def load_progress(path):
+    try:
+        with open(path) as f:
+            return set(json.load(f).get('done', []))
+    except FileNotFoundError:
+        return set()
+
+
+def save_progress(path, done):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'done': sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+# Season ids of a region, oldest first
+async def list_seasons(region, locale):
+    seasons_data, status_code = await fetch_data(api_url(region, "data/d3/season/", locale=locale))
+    if status_code != 200:
+        raise RuntimeError(f"Failed to fetch the season index for {region}: {status_code}")
+    current_season = seasons_data.get('current_season') or len(seasons_data.get('season', []))
+    return list(range(1, current_season + 1))
+
+
+# Rift leaderboards of a season, as listed by the season document
+async def list_leaderboards(region, season_id, locale):
+    season_data, status_code = await fetch_data(api_url(region, f"data/d3/season/{season_id}", locale=locale))
+    if status_code != 200:
+        return list(RIFT_LEADERBOARDS)
+    names = [
+        board.get('ladder', {}).get('href', '').split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+        for board in season_data.get('leaderboard', [])
+    ]
+    return [name for name in names if name.startswith('rift-')] or list(RIFT_LEADERBOARDS)
+
+
+async def crawl(regions, season_ids, leaderboard_names, locale, concurrency, progress_path):
+    done = load_progress(progress_path)
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+
+    async def crawl_board(region, season_id, leaderboard_name):
+        task_key = f"{region}/{season_id}/{leaderboard_name}"
+        async with semaphore:
+            try:
+                rows, status_code = await fetch_flat_leaderboard(season_id, leaderboard_name, region, locale)
+            except Exception as err:
+                rows, status_code = None, str(err)
+            if status_code != 200:
+                print(f"FAILED {task_key}: {status_code}")
+                failed.append(task_key)
+                return
+            # Finished seasons are snapshotted by fetch_flat_leaderboard, but not
+            # when their rows came from the cache: write the final snapshot if
+            # it is still missing. Keep a copy of the running season's boards
+            # too, for offline use.
+            if snapshots.available():
+                loop = asyncio.get_running_loop()
+                final = await is_past_season(season_id, region)
+                if not final or not await loop.run_in_executor(
+                        None, snapshots.has_final_snapshot, region, season_id, leaderboard_name):
+                    await loop.run_in_executor(
+                        None, lambda: snapshots.write_snapshot(region, season_id, leaderboard_name, rows, final=final))
+        done.add(task_key)
+        save_progress(progress_path, done)
+        print(f"ok     {task_key} ({len(rows)} rows)")
+
+    async def crawl_region(region):
+        seasons = season_ids or await list_seasons(region, locale)
+        tasks = []
+        for season_id in seasons:
+            names = leaderboard_names or await list_leaderboards(region, season_id, locale)
+            tasks += [
+                crawl_board(region, season_id, name) for name in names
+                if f"{region}/{season_id}/{name}" not in done
+            ]
+        await asyncio.gather(*tasks)
+
+    results = await asyncio.gather(*(crawl_region(region) for region in regions), return_exceptions=True)
+    for region, result in zip(regions, results):
+        if isinstance(result, Exception):
+            print(f"FAILED {region}: {result}")
+            failed.append(region)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pre-warm the leaderboard cache and snapshots.",
+        epilog="A full crawl needs a larger cache than the defaults, e.g. "
+               "CACHE_THRESHOLD=20000 CACHE_MAX_BYTES=8589934592 (8 GB).")
+    parser.add_argument('--regions', nargs='+', default=list(REGIONS), choices=REGIONS)
+    parser.add_argument('--seasons', nargs='+', type=int, help="season ids (default: every season)")
+    parser.add_argument('--leaderboards', nargs='+', help="leaderboard names (default: every rift-* board)")
+    parser.add_argument('--locale', default="en_US")
+    parser.add_argument('--concurrency', type=int, default=CRAWL_CONCURRENCY)
+    parser.add_argument('--progress-file', default=PROGRESS_FILE)
+    parser.add_argument('--restart', action='store_true', help="ignore the progress of a previous crawl")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.progress_file):
+        os.remove(args.progress_file)
+
+    failed = client.run(with_priority(BACKGROUND, crawl(
+        args.regions, args.seasons, args.leaderboards, args.locale, args.concurrency, args.progress_file,
+    )))
+    if failed:
+        print(f"{len(failed)} failed, run again to retry them")
+        return 1
+    if os.path.exists(args.progress_file):
+        os.remove(args.progress_file)
+    print("Crawl complete")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+# Raised for a bad argument of an API request (unknown region, field...).
+# The app answers it with a 400 carrying its message; any other exception is
+# a server fault and stays a 500.
+class InvalidRequest(ValueError):
+    pass
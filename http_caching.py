@@ -0,0 +1,37 @@
+import os
+import gzip
+import hashlib
+
+# brotli is optional: without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+
+# Compression levels; variants are cached, so each body is compressed once
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+# Strong validator derived from the response body
+def body_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+# Best encoding the client accepts ('br', 'gzip') or None for identity.
+# accept_encodings is werkzeug's parsed Accept-Encoding header.
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
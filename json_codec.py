@@ -0,0 +1,56 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional: it parses and serialises several times faster than the
+# standard library, which matters for multi-megabyte leaderboards. Without it
+# everything falls back to the json module.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Parse a JSON document from bytes or str
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Serialise to compact UTF-8 JSON bytes
+def dumps(obj, default=None):
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+# Flask JSON provider (jsonify, request.get_json) backed by orjson. Output
+# matches the default provider: sorted keys, indented in debug mode, and
+# dates and other extra types converted by Flask's own default().
+class FastJSONProvider(DefaultJSONProvider):
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
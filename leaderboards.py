@@ -0,0 +1,277 @@
+import re
+import time
+import heapq
+
+# numpy and pandas are optional: only the columnar helpers below need them
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from errors import InvalidRequest
+
+# Seasonal greater rift leaderboards, one per hero class
+RIFT_LEADERBOARDS = [
+    'rift-barbarian',
+    'rift-wizard',
+    'rift-dh',
+    'rift-monk',
+    'rift-necromancer',
+    'rift-wd',
+    'rift-crusader',
+]
+
+# Blizzard leaderboard ids: lowercase words joined by dashes (e.g. 'rift-team-2')
+LEADERBOARD_NAME_PATTERN = re.compile(r'^[a-z0-9]+(-[a-z0-9]+)*$')
+
+
+def is_leaderboard_name(name):
+    return LEADERBOARD_NAME_PATTERN.match(name) is not None
+
+# Compact row field -> (Blizzard entry id, entry value key), read from row['data']
+ROW_FIELDS = {
+    'rank': ('Rank', 'number'),
+    'battleTag': ('BattleTag', 'string'),
+    'riftLevel': ('RiftLevel', 'number'),
+    'riftTime': ('RiftTime', 'timestamp'),
+    'completedTime': ('CompletedTime', 'timestamp'),
+}
+
+# Same, read from the first player's player[0]['data']
+PLAYER_FIELDS = {
+    'heroBattleTag': ('HeroBattleTag', 'string'),
+    'heroClass': ('HeroClass', 'string'),
+    'heroId': ('HeroId', 'number'),
+    'heroLevel': ('HeroLevel', 'number'),
+    'heroGender': ('HeroGender', 'string'),
+    'paragonLevel': ('ParagonLevel', 'number'),
+    'clanTag': ('HeroClanTag', 'string'),
+    'clanName': ('ClanName', 'string'),
+}
+
+FLAT_FIELDS = list(ROW_FIELDS) + list(PLAYER_FIELDS) + ['leaderboard']
+
+
+# Blizzard entry id -> (flat field, entry value key), to read a row's entries
+# in a single pass without indexing them first
+_ROW_ENTRIES = {entry_id: (name, value_key) for name, (entry_id, value_key) in ROW_FIELDS.items()}
+_PLAYER_ENTRIES = {entry_id: (name, value_key) for name, (entry_id, value_key) in PLAYER_FIELDS.items()}
+
+
+def _read_entries(entries, lookup, flat):
+    for entry in entries:
+        field = lookup.get(entry.get('id'))
+        if field is not None:
+            flat[field[0]] = entry.get(field[1])
+
+
+# Turn one raw leaderboard row into a flat dict of the fields the UI uses
+def flatten_row(row, leaderboard_name):
+    flat = dict.fromkeys(FLAT_FIELDS)
+    _read_entries(row.get('data', []), _ROW_ENTRIES, flat)
+    players = row.get('player') or [{}]
+    _read_entries(players[0].get('data', []), _PLAYER_ENTRIES, flat)
+    if not flat['battleTag']:
+        flat['battleTag'] = flat['heroBattleTag']
+    flat['leaderboard'] = leaderboard_name
+    return flat
+
+
+# Flatten a raw Blizzard leaderboard payload, best rows first
+def flatten_leaderboard(data, leaderboard_name):
+    rows = [flatten_row(row, leaderboard_name) for row in data.get('row', [])]
+    rows.sort(key=sort_key)
+    return rows
+
+
+# Rift level descending, then rift time ascending (faster is better)
+def sort_key(row):
+    return (-(row['riftLevel'] or 0), row['riftTime'] or float('inf'))
+
+
+# k-way merge of already sorted flat leaderboards
+def merge_leaderboards(boards):
+    return list(heapq.merge(*boards, key=sort_key))
+
+
+# Copies of the rows of a region's board, marked with that region. Ranks stay
+# the regional ones; the order of a merged list gives the global ranking.
+def tag_region(rows, region):
+    return [dict(row, region=region) for row in rows]
+
+
+def paginate(rows, offset, limit):
+    return {
+        "total": len(rows),
+        "offset": offset,
+        "limit": limit,
+        "rows": rows[offset:offset + limit],
+    }
+
+
+# Keep the rows matching every given filter; clan matches tag or name, and
+# filters on text are case-insensitive
+def filter_rows(rows, min_rift_level=None, clan=None, battletag_prefix=None):
+    if min_rift_level is not None:
+        rows = [row for row in rows if (row['riftLevel'] or 0) >= min_rift_level]
+    if clan:
+        clan = clan.lower()
+        rows = [
+            row for row in rows
+            if clan in ((row['clanTag'] or '').lower(), (row['clanName'] or '').lower())
+        ]
+    if battletag_prefix:
+        battletag_prefix = battletag_prefix.lower()
+        rows = [row for row in rows if (row['battleTag'] or '').lower().startswith(battletag_prefix)]
+    return rows
+
+
+# Restrict rows to the given fields ('region' is only set on multi-region rows)
+def project(rows, fields):
+    unknown = [field for field in fields if field not in FLAT_FIELDS and field != 'region']
+    if unknown:
+        raise InvalidRequest(f"Unknown leaderboard fields: {', '.join(unknown)}")
+    return [{field: row.get(field) for field in fields} for row in rows]
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is required for columnar leaderboards (pip install numpy pandas)")
+
+
+# Flatten a raw Blizzard leaderboard payload into one array per flat field, in
+# upstream order. Numeric fields are float arrays (NaN when missing), text
+# fields object arrays (None when missing).
+def leaderboard_columns(data, leaderboard_name):
+    _require_numpy()
+    rows = data.get('row', [])
+    columns = {name: [None] * len(rows) for name in FLAT_FIELDS}
+    lookups = (
+        {entry_id: (columns[name], value_key) for entry_id, (name, value_key) in _ROW_ENTRIES.items()},
+        {entry_id: (columns[name], value_key) for entry_id, (name, value_key) in _PLAYER_ENTRIES.items()},
+    )
+
+    for index, row in enumerate(rows):
+        players = row.get('player') or [{}]
+        for entries, lookup in zip((row.get('data', []), players[0].get('data', [])), lookups):
+            for entry in entries:
+                column = lookup.get(entry.get('id'))
+                if column is not None:
+                    column[0][index] = entry.get(column[1])
+
+    arrays = {}
+    for name, values in columns.items():
+        kind = ROW_FIELDS.get(name) or PLAYER_FIELDS.get(name)
+        if kind is not None and kind[1] != 'string':
+            arrays[name] = np.array(values, dtype=np.float64)
+        else:
+            arrays[name] = np.array(values, dtype=object)
+    missing_tag = np.isin(arrays['battleTag'], [None, ''])
+    arrays['battleTag'][missing_tag] = arrays['heroBattleTag'][missing_tag]
+    arrays['leaderboard'][:] = leaderboard_name
+    return arrays
+
+
+# Rift times in milliseconds as 'mm:ss' strings ('N/A' where missing)
+def format_rift_times(milliseconds):
+    _require_numpy()
+    if hasattr(milliseconds, 'to_numpy'):  # pandas Series, possibly nullable
+        milliseconds = milliseconds.to_numpy(dtype=np.float64, na_value=np.nan)
+    milliseconds = np.asarray(milliseconds, dtype=np.float64)
+    # np.char.zfill fails on zero-size arrays (numpy 2)
+    if milliseconds.size == 0:
+        return np.empty(milliseconds.shape, dtype=object)
+    missing = np.isnan(milliseconds)
+    seconds = np.where(missing, 0, milliseconds // 1000).astype(np.int64)
+    text = np.char.add(
+        np.char.add(np.char.zfill((seconds // 60).astype(str), 2), ':'),
+        np.char.zfill((seconds % 60).astype(str), 2),
+    ).astype(object)
+    text[missing] = 'N/A'
+    return text
+
+
+# A raw leaderboard payload as a pandas DataFrame with the flat fields as
+# columns (integer fields use the nullable Int64 dtype) plus riftTimeText
+def leaderboard_frame(data, leaderboard_name):
+    if pd is None:
+        raise RuntimeError("pandas is required for leaderboard DataFrames (pip install pandas)")
+    columns = leaderboard_columns(data, leaderboard_name)
+    frame = pd.DataFrame(columns, columns=FLAT_FIELDS)
+    for name in ('rank', 'riftLevel', 'riftTime', 'completedTime', 'heroId', 'heroLevel', 'paragonLevel'):
+        frame[name] = frame[name].astype('Int64')
+    frame['riftTimeText'] = format_rift_times(columns['riftTime'])
+    return frame
+
+
+# Normalise a BattleTag for lookups ('Name-1234' and 'name#1234' are the same)
+def battletag_key(battletag):
+    return (battletag or '').replace('-', '#').lower()
+
+
+# In-memory index from BattleTag to the player's rows on each leaderboard of a
+# season, maintained as flat leaderboards are loaded. Boards indexed more than
+# max_age seconds ago are dropped, as are the least recently indexed ones beyond
+# max_boards, so the index stays bounded however many seasons get looked at.
+# Only used from the client loop, so it needs no locking.
+class BattleTagIndex:
+    def __init__(self, max_age=None, max_boards=None):
+        self.max_age = max_age
+        self.max_boards = max_boards
+        self._players = {}  # (region, season_id) -> {battletag key: {leaderboard: row}}
+        self._boards = {}   # (region, season_id, leaderboard) -> (indexed at, battletag keys), oldest first
+
+    def add_board(self, region, season_id, leaderboard_name, rows):
+        board_key = (region, season_id, leaderboard_name)
+        # Drop what the previous version of this board contributed
+        self._drop_board(board_key)
+        self._evict()
+
+        players = self._players.setdefault((region, season_id), {})
+        keys = set()
+        for row in rows:
+            key = battletag_key(row['battleTag'])
+            if key:
+                players.setdefault(key, {})[leaderboard_name] = row
+                keys.add(key)
+        self._boards[board_key] = (time.time(), keys)
+
+    def _drop_board(self, board_key):
+        indexed = self._boards.pop(board_key, None)
+        if indexed is None:
+            return
+        region, season_id, leaderboard_name = board_key
+        players = self._players.get((region, season_id), {})
+        for key in indexed[1]:
+            entries = players.get(key)
+            if entries is not None:
+                entries.pop(leaderboard_name, None)
+                if not entries:
+                    del players[key]
+        if not players:
+            self._players.pop((region, season_id), None)
+
+    # Make room for one more board
+    def _evict(self):
+        now = time.time()
+        for board_key, (indexed_at, _) in list(self._boards.items()):
+            expired = self.max_age is not None and now - indexed_at > self.max_age
+            full = self.max_boards is not None and len(self._boards) >= self.max_boards
+            if not expired and not full:
+                break
+            self._drop_board(board_key)
+
+    # Seconds since the board was indexed, or None if it never was
+    def board_age(self, region, season_id, leaderboard_name):
+        indexed = self._boards.get((region, season_id, leaderboard_name))
+        return None if indexed is None else time.time() - indexed[0]
+
+    # The player's rows on every indexed leaderboard, best first
+    def lookup(self, region, season_id, battletag):
+        entries = self._players.get((region, season_id), {}).get(battletag_key(battletag), {})
+        return sorted(entries.values(), key=sort_key)
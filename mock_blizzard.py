@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+# Local stand-in for the Blizzard API and OAuth endpoints, for load tests and
+# offline work. Start it, then point the app at it:
+#
+#   python mock_blizzard.py --port 8081 --latency-ms 80 --error-rate 0.01
+#   BLIZZARD_API_BASE_URL=http://127.0.0.1:8081/{region} \
+#   BLIZZARD_AUTH_URL=http://127.0.0.1:8081/token python app.py
+#
+# Responses are replayed from fixtures/: a recorded response saved as
+# fixtures/recorded/<region>/<path>.json wins, otherwise the fixture of the
+# resource kind (fixtures/<kind>.json) is served. Leaderboards are generated,
+# so that every season and class has a full board. GET /_stats returns the
+# request counts per kind and POST /_reset clears them.
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Resource kind of each API path (region prefix removed)
+ROUTES = [
+    (re.compile(r'^data/d3/season/?$'), 'seasons'),
+    (re.compile(r'^data/d3/season/\d+/?$'), 'season'),
+    (re.compile(r'^data/d3/season/\d+/leaderboard/[\w-]+/?$'), 'leaderboard'),
+    (re.compile(r'^d3/profile/[^/]+/?$'), 'profile'),
+    (re.compile(r'^d3/profile/[^/]+/hero/\d+/?$'), 'hero'),
+    (re.compile(r'^d3/profile/[^/]+/hero/\d+/items/?$'), 'items'),
+    (re.compile(r'^d3/profile/[^/]+/hero/\d+/follower-items/?$'), 'follower-items'),
+    (re.compile(r'^d3/profile/[^/]+/achievements/?$'), 'achievements'),
+    (re.compile(r'^d3/data/item/[^/]+/?$'), 'item'),
+    (re.compile(r'^d3/data/act/?$'), 'act'),
+    (re.compile(r'^d3/data/artisan/[\w-]+/?$'), 'artisan'),
+    (re.compile(r'^d3/data/item-type/?$'), 'item-types'),
+    (re.compile(r'^d3/data/item-type/[\w-]+/?$'), 'item-type'),
+    (re.compile(r'^d3/data/hero/[\w-]+/?$'), 'hero-class'),
+    (re.compile(r'^d3/data/hero/[\w-]+/skill/[\w-]+/?$'), 'skill'),
+]
+
+HERO_CLASSES = {
+    'rift-barbarian': 'barbarian', 'rift-wizard': 'wizard', 'rift-dh': 'demon hunter', 'rift-monk': 'monk',
+    'rift-necromancer': 'necromancer', 'rift-wd': 'witch doctor', 'rift-crusader': 'crusader',
+}
+
+
+def route_kind(path):
+    for pattern, kind in ROUTES:
+        if pattern.match(path):
+            return kind
+    return None
+
+
+# A generated leaderboard: 'rows' players of a made-up population shared by
+# every board, so that profile lookups behind /api/most_used_items fan out
+def generate_leaderboard(season_id, leaderboard_name, rows):
+    rng = random.Random(f"{season_id}/{leaderboard_name}")
+    hero_class = HERO_CLASSES.get(leaderboard_name, leaderboard_name.replace('rift-', ''))
+    entries = []
+    rift_time = 400000
+    for index in range(rows):
+        rift_time += rng.randint(0, 2000)
+        player = rng.randint(1, rows * 10)
+        battle_tag = f"Player{player}#{1000 + player}"
+        entries.append({
+            "player": [{
+                "key": f"{player}",
+                "accountId": player,
+                "data": [
+                    {"id": "HeroBattleTag", "string": battle_tag},
+                    {"id": "GameAccount", "number": player},
+                    {"id": "HeroClass", "string": hero_class},
+                    {"id": "HeroGender", "string": rng.choice("mf")},
+                    {"id": "HeroLevel", "number": 70},
+                    {"id": "ParagonLevel", "number": rng.randint(800, 5000)},
+                    {"id": "HeroClanTag", "string": rng.choice(["", "MOCK", "TEST"])},
+                    {"id": "ClanName", "string": ""},
+                    {"id": "HeroId", "number": 101},
+                ],
+            }],
+            "order": index + 1,
+            "data": [
+                {"id": "Rank", "number": index + 1},
+                {"id": "RiftLevel", "number": 150 - index // 50},
+                {"id": "RiftTime", "timestamp": rift_time},
+                {"id": "CompletedTime", "timestamp": 1720519200000 - index * 1000},
+                {"id": "BattleTag", "string": battle_tag},
+            ],
+        })
+    return {
+        "row": entries,
+        "key": {"type": "LEADERBOARD", "id": leaderboard_name},
+        "title": {"en_US": leaderboard_name},
+        "season": season_id,
+        "last_update_time": "Tue, 09 Jul 2024 10:00:00 GMT",
+        "generated_by": "mock",
+    }
+
+
+class MockBlizzard:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 error_status=503, rate_limit_rate=0.0, leaderboard_rows=1000):
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.leaderboard_rows = leaderboard_rows
+        self.stats = Counter()
+        self._bodies = {}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/token', self.token)
+        app.router.add_get('/_stats', self.get_stats)
+        app.router.add_post('/_reset', self.reset_stats)
+        app.router.add_get('/{region}/{path:.*}', self.api)
+        return app
+
+    async def _delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _fixture(self, name):
+        with open(os.path.join(self.fixtures_dir, f"{name}.json"), 'rb') as f:
+            return f.read()
+
+    # Serialised body of a resource, built once
+    def _body(self, region, path, kind):
+        key = (region, path)
+        body = self._bodies.get(key)
+        if body is None:
+            recorded = os.path.join(self.fixtures_dir, 'recorded', region, f"{path.strip('/')}.json")
+            if os.path.exists(recorded):
+                with open(recorded, 'rb') as f:
+                    body = f.read()
+            elif kind == 'leaderboard':
+                parts = path.strip('/').split('/')
+                body = json.dumps(generate_leaderboard(int(parts[3]), parts[5], self.leaderboard_rows)).encode()
+            else:
+                body = self._fixture(kind)
+            self._bodies[key] = body
+        return body
+
+    async def token(self, request):
+        self.stats['token'] += 1
+        await self._delay()
+        return web.Response(body=self._fixture('token'), content_type='application/json')
+
+    async def api(self, request):
+        region, path = request.match_info['region'], request.match_info['path']
+        kind = route_kind(path)
+        self.stats['total'] += 1
+        self.stats[kind or 'unknown'] += 1
+        await self._delay()
+
+        if not request.headers.get('Authorization', '').startswith('Bearer '):
+            return web.json_response({"code": 401, "type": "BLZWEBAPI00000401", "detail": "Unauthorized"}, status=401)
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            self.stats['injected_429'] += 1
+            return web.json_response({"code": 429, "detail": "Too many requests"}, status=429, headers={'Retry-After': '1'})
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats['injected_errors'] += 1
+            return web.json_response({"code": self.error_status, "detail": "Injected error"}, status=self.error_status)
+        if kind is None:
+            return web.json_response({"code": 404, "type": "BLZWEBAPI00000404", "detail": "Not Found"}, status=404)
+
+        body = self._body(region, path, kind)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            self.stats['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    async def get_stats(self, request):
+        return web.json_response(dict(self.stats))
+
+    async def reset_stats(self, request):
+        self.stats.clear()
+        return web.json_response({})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Blizzard Diablo III API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--latency-ms', type=float, default=50, help="added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="latency varies by up to this much")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of API calls answered with --error-status")
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of API calls answered 429")
+    parser.add_argument('--leaderboard-rows', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    mock = MockBlizzard(args.fixtures, args.latency_ms, args.jitter_ms, args.error_rate,
+                        args.error_status, args.rate_limit_rate, args.leaderboard_rows)
+    web.run_app(mock.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
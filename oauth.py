@@ -0,0 +1,126 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds before expiry at which a token is renewed in the background
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 300))
+# Seconds a worker waits for another worker's refresh before doing its own
+TOKEN_LOCK_TIMEOUT = 10
+
+
+# The OAuth access token, shared by every request and worker process.
+#
+# The token is held in memory and in the given cache, so every worker using
+# the same cache uses the same token. It is renewed in the background shortly
+# before it expires; requests only wait for a token when none is held yet.
+# request_token() is a coroutine function returning (access_token, expires_in).
+# All async methods run on the shared client loop; cache calls are handed to
+# the given executor so they never block it.
+class TokenManager:
+    def __init__(self, cache, request_token, key='oauth:token', refresh_margin=TOKEN_REFRESH_MARGIN, executor=None):
+        self._cache = cache
+        self._executor = executor
+        self._request_token = request_token
+        self._key = key
+        self._lock_key = f"{key}:refreshing"
+        self.refresh_margin = refresh_margin
+        self._entry = None  # {'access_token', 'expires_at', 'refresh_at'}
+        self._refreshing = None
+
+    async def _cache_call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    # The held token, or a newer one another worker saved to the cache
+    async def _current(self):
+        entry = self._entry
+        if entry is None or time.time() >= entry['refresh_at']:
+            shared = await self._cache_call(self._cache.get, self._key)
+            if shared is not None and (entry is None or shared['expires_at'] > entry['expires_at']):
+                self._entry = entry = shared
+        if entry is None or time.time() >= entry['expires_at']:
+            return None
+        return entry
+
+    # A valid token. A token due for renewal is still returned while its
+    # successor is fetched in the background.
+    async def get(self):
+        entry = await self._current()
+        if entry is None:
+            return await self.refresh()
+        if time.time() >= entry['refresh_at']:
+            self._schedule()
+        return entry['access_token']
+
+    # The upstream rejected 'token' (401): return a new token, fetching one
+    # unless that already happened since 'token' was handed out
+    async def invalidate(self, token):
+        for entry in (self._entry, await self._cache_call(self._cache.get, self._key)):
+            if entry is not None and entry['access_token'] != token and time.time() < entry['expires_at']:
+                self._entry = entry
+                return entry['access_token']
+        self._entry = None
+        await self._cache_call(self._cache.delete, self._key)
+        return await self.refresh()
+
+    # Fetch a new token, sharing the work with a refresh already in flight
+    async def refresh(self):
+        return await asyncio.shield(self._schedule())
+
+    def _schedule(self):
+        task = self._refreshing
+        if task is None:
+            task = self._refreshing = asyncio.ensure_future(self._refresh())
+            task.add_done_callback(lambda _: setattr(self, '_refreshing', None))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def _refresh(self):
+        held = self._entry
+        # Only one worker asks the upstream; the others pick up its token
+        owner = uuid.uuid4().hex
+        acquired = await self._cache_call(self._cache.add, self._lock_key, owner, timeout=TOKEN_LOCK_TIMEOUT)
+        if not acquired:
+            deadline = time.time() + TOKEN_LOCK_TIMEOUT
+            while time.time() < deadline and await self._cache_call(self._cache.has, self._lock_key):
+                await asyncio.sleep(0.1)
+                shared = await self._cache_call(self._cache.get, self._key)
+                if shared is not None and shared != held and time.time() < shared['refresh_at']:
+                    self._entry = shared
+                    return shared['access_token']
+        try:
+            access_token, expires_in = await self._request_token()
+            now = time.time()
+            self._entry = entry = {
+                'access_token': access_token,
+                'expires_at': now + expires_in,
+                'refresh_at': now + expires_in - min(self.refresh_margin, expires_in / 2),
+            }
+            await self._cache_call(self._cache.set, self._key, entry, timeout=expires_in)
+            return access_token
+        finally:
+            # Never release a lock another worker holds (ours may have expired)
+            if acquired and await self._cache_call(self._cache.get, self._lock_key) == owner:
+                await self._cache_call(self._cache.delete, self._lock_key)
+
+    # Renew the token ahead of its expiry, forever. A failed refresh is
+    # retried while the current token is still in use.
+    async def run_periodic(self):
+        while True:
+            entry = await self._current()
+            delay = 0 if entry is None else entry['refresh_at'] - time.time()
+            # Workers wake up at slightly different times so one refreshes first
+            await asyncio.sleep(max(delay, 0) + random.uniform(0, 2))
+            entry = await self._current()
+            if entry is not None and time.time() < entry['refresh_at']:
+                continue
+            try:
+                await self.refresh()
+            except Exception as err:
+                logger.warning("Failed to refresh the OAuth token: %s", err)
+                await asyncio.sleep(10)
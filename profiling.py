@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import uuid
+import asyncio
+import weakref
+import threading
+import collections
+import contextvars
+
+import json_codec
+
+# On-demand profiling of single requests. While a profiled request runs, a
+# sampler thread records the Python stacks working for it: the request's own
+# thread (e.g. template rendering, compression) and the client loop thread
+# whenever it runs a task started by that request. Time spent waiting on the
+# cache and upstream is recorded separately. The result is written as a
+# collapsed-stack file (for flamegraph.pl or speedscope) plus a JSON summary.
+
+# Id of the profile of the request being served (None when not profiled).
+# Copied into the client loop with the rest of the request context.
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return names[::-1]
+
+
+# A thread blocked waiting for the client loop to finish the request's work
+def _is_waiting(frame):
+    return frame.f_code.co_name == 'wait' and frame.f_code.co_filename.endswith('threading.py')
+
+
+class Profile:
+    def __init__(self, trace_id, request_thread, interval):
+        self.id = uuid.uuid4().hex
+        self.trace_id = trace_id
+        self.request_thread = request_thread
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = collections.Counter()  # 'cpu' / 'wait'
+        self.io = collections.defaultdict(lambda: [0.0, 0])  # kind -> [seconds, calls]
+        self.started = time.perf_counter()
+        self.wall = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_io(self, kind, seconds):
+        with self._lock:
+            entry = self.io[kind]
+            entry[0] += seconds
+            entry[1] += 1
+
+    def summary(self):
+        with self._lock:
+            io = {kind: {"ms": round(seconds * 1000, 1), "calls": calls} for kind, (seconds, calls) in self.io.items()}
+        return {
+            "id": self.id,
+            "trace_id": self.trace_id,
+            "wall_ms": round((self.wall or 0) * 1000, 1),
+            "interval_ms": self.interval * 1000,
+            "cpu_ms": round(self.samples['cpu'] * self.interval * 1000, 1),
+            "wait_ms": round(self.samples['wait'] * self.interval * 1000, 1),
+            "io": io,
+        }
+
+    def folded(self):
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# Profiles by id, and the sampler that feeds them
+class Profiler:
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._loop = None
+        self._loop_thread = None
+        self._task_profiles = None
+        self._profiles = {}
+
+    # Tag every task created on the loop for a profiled request with its
+    # profile id, so the sampler can tell which request the running task serves
+    def install(self, loop):
+        self._loop = loop
+        self._task_profiles = weakref.WeakKeyDictionary()
+
+        def task_factory(loop, coro, **kwargs):
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+            profile_id = current_profile.get()
+            if profile_id is not None:
+                self._task_profiles[task] = profile_id
+            return task
+
+        def install_factory():
+            self._loop_thread = threading.get_ident()
+            loop.set_task_factory(task_factory)
+
+        loop.call_soon_threadsafe(install_factory)
+
+    # Start profiling the calling thread's request; the caller sets
+    # current_profile to the returned profile's id for the request
+    def start(self, trace_id):
+        profile = Profile(trace_id, threading.get_ident(), self.interval)
+        self._profiles[profile.id] = profile
+        profile._thread = threading.Thread(target=self._sample, args=(profile,), name='profiler', daemon=True)
+        profile._thread.start()
+        return profile
+
+    # Record time the current request spent waiting on something ('upstream', 'cache'...)
+    def add_io(self, kind, seconds):
+        profile_id = current_profile.get()
+        if profile_id is not None:
+            profile = self._profiles.get(profile_id)
+            if profile is not None:
+                profile.add_io(kind, seconds)
+
+    # Stop sampling and save the profile; returns it
+    def stop(self, profile_id):
+        profile = self._profiles.pop(profile_id, None)
+        if profile is None:
+            return None
+        profile.wall = time.perf_counter() - profile.started
+        profile._stop.set()
+        profile._thread.join()
+        self._save(profile)
+        return profile
+
+    def _save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(profile.id, 'folded'), 'w') as f:
+            f.write(profile.folded())
+        with open(self.path(profile.id, 'json'), 'wb') as f:
+            f.write(json_codec.dumps(profile.summary()))
+
+    def path(self, profile_id, extension):
+        return os.path.join(self.directory, f"{os.path.basename(profile_id)}.{extension}")
+
+    def _sample(self, profile):
+        while not profile._stop.wait(profile.interval):
+            frames = sys._current_frames()
+            busy = False
+
+            frame = frames.get(profile.request_thread)
+            if frame is not None and not _is_waiting(frame):
+                profile.stacks[tuple(['request'] + _stack(frame))] += 1
+                busy = True
+
+            if self._loop is not None and self._loop_thread in frames:
+                task = asyncio.current_task(self._loop)
+                if task is not None and self._task_profiles.get(task) == profile.id:
+                    profile.stacks[tuple(['client-loop'] + _stack(frames[self._loop_thread]))] += 1
+                    busy = True
+
+            profile.samples['cpu' if busy else 'wait'] += 1
@@ -0,0 +1,103 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+
+# Request priorities, lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Priority of the upstream calls made from the current task. Routes run with
+# the default; background jobs wrap their work in with_priority(BACKGROUND).
+current_priority = contextvars.ContextVar('current_priority', default=INTERACTIVE)
+
+
+async def with_priority(priority, coro):
+    token = current_priority.set(priority)
+    try:
+        return await coro
+    finally:
+        current_priority.reset(token)
+
+
+# Classic token bucket: 'rate' tokens per second, holding at most 'capacity'
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until a token is available (0 if one is available now)
+    def wait_time(self, now):
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+# Admits upstream calls so that every bucket's quota is respected, serving
+# waiting calls by priority then arrival order. pause() stops all traffic for
+# a while, e.g. after the upstream answered 429 with a Retry-After.
+# Must be used from a single event loop (the client loop).
+class RateLimiter:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._waiters = []
+        self._order = itertools.count()
+        self._paused_until = 0
+        self._dispatcher = None
+
+    async def acquire(self, priority=None):
+        if priority is None:
+            priority = current_priority.get()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def queued(self):
+        return len(self._waiters)
+
+    async def _dispatch(self):
+        while self._waiters:
+            now = time.monotonic()
+            wait = max([self._paused_until - now] + [bucket.wait_time(now) for bucket in self.buckets])
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # the waiter was cancelled
+                continue
+            for bucket in self.buckets:
+                bucket.take(now)
+            future.set_result(None)
+
+
+# Delay before retry number 'attempt' (0-based): full-jitter exponential
+# backoff, never shorter than what the upstream asked for in Retry-After
+def backoff_delay(attempt, base, cap, retry_after=None):
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# Retry-After header value in seconds (only the delta-seconds form is used)
+def parse_retry_after(value):
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,163 @@
+import os
+import re
+import time
+import pickle
+import sqlite3
+import threading
+
+from flask_caching.backends.base import BaseCache
+
+# Seconds upstream responses stay cached, per class of Blizzard resource.
+# Game data only changes with patches, leaderboards update every few minutes
+# and profiles change as soon as someone plays.
+TTL_CLASSES = {
+    'static': int(os.getenv('CACHE_TTL_STATIC', 3 * 24 * 3600)),
+    'season': int(os.getenv('CACHE_TTL_SEASON', 3600)),
+    'leaderboard': int(os.getenv('CACHE_TTL_LEADERBOARD', 300)),
+    'profile': int(os.getenv('CACHE_TTL_PROFILE', 60)),
+    'default': int(os.getenv('CACHE_TTL_DEFAULT', 300)),
+}
+
+# Seconds an entry is kept past its TTL so it can still be served while a
+# background refresh revalidates it
+STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 24 * 3600))
+
+# First matching URL path pattern decides the TTL class
+_TTL_PATTERNS = [
+    (re.compile(r'/data/d3/season/\d+/leaderboard/'), 'leaderboard'),
+    (re.compile(r'/data/d3/season/'), 'season'),
+    (re.compile(r'/d3/data/'), 'static'),
+    (re.compile(r'/d3/profile/'), 'profile'),
+]
+
+
+def ttl_class(url):
+    for pattern, name in _TTL_PATTERNS:
+        if pattern.search(url):
+            return name
+    return 'default'
+
+
+def ttl_for(url):
+    return TTL_CLASSES[ttl_class(url)]
+
+
+# Flask-Caching backend storing entries in a SQLite file, so every worker
+# process on the host shares one cache that survives restarts. The cache is
+# bounded both in entries and in bytes; least recently used entries go first.
+class SQLiteLRUCache(BaseCache):
+    # Eviction runs once every this many writes
+    EVICT_EVERY = 32
+    # A hit only rewrites the entry's access time when it is older than this
+    # (seconds), so most reads stay read-only transactions
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, path, threshold=5000, max_bytes=512 * 1024 * 1024, default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._db() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, accessed REAL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = os.path.join(config['CACHE_DIR'] or '.cache', 'responses.sqlite')
+        kwargs.update(
+            threshold=config['CACHE_THRESHOLD'],
+            max_bytes=config.get('CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        )
+        return cls(path, *args, **kwargs)
+
+    # One connection per thread; WAL lets readers and a writer work concurrently
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return 0 if timeout == 0 else time.time() + timeout
+
+    def get(self, key):
+        db = self._db()
+        row = db.execute('SELECT value, expires, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        now = time.time()
+        if expires and expires <= now:
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        if now - accessed >= self.ACCESS_RESOLUTION:
+            db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(value)
+
+    def has(self, key):
+        row = self._db().execute('SELECT expires FROM entries WHERE key = ?', (key,)).fetchone()
+        return row is not None and (not row[0] or row[0] > time.time())
+
+    def set(self, key, value, timeout=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._db().execute(
+            'INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, data, len(data), self._expires(timeout), time.time()),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict()
+        return True
+
+    # Atomic across workers: of concurrent adds of a key, exactly one succeeds
+    def add(self, key, value, timeout=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM entries WHERE key = ? AND expires > 0 AND expires <= ?', (key, now))
+            added = db.execute(
+                'INSERT OR IGNORE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data), self._expires(timeout), now),
+            ).rowcount > 0
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return added
+
+    def delete(self, key):
+        return self._db().execute('DELETE FROM entries WHERE key = ?', (key,)).rowcount > 0
+
+    def clear(self):
+        self._db().execute('DELETE FROM entries')
+        return True
+
+    def _evict(self):
+        db = self._db()
+        db.execute('DELETE FROM entries WHERE expires > 0 AND expires <= ?', (time.time(),))
+        db.execute(
+            'DELETE FROM entries WHERE key IN '
+            '(SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.threshold,),
+        )
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        while total > self.max_bytes:
+            row = db.execute('SELECT key, size FROM entries ORDER BY accessed LIMIT 1').fetchone()
+            if row is None:
+                break
+            db.execute('DELETE FROM entries WHERE key = ?', (row[0],))
+            total -= row[1]
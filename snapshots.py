@@ -0,0 +1,151 @@
+import os
+import time
+
+# pyarrow (and pandas, for the DataFrame loader) are optional: without them
+# the app simply never reads or writes snapshots
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from leaderboards import RIFT_LEADERBOARDS
+
+# Flattened leaderboards are stored one Arrow IPC file per
+# <region>/season-<id>/<leaderboard>.arrow under this directory
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+
+# Column types of a snapshot, one column per flat leaderboard field
+if pa is not None:
+    SCHEMA = pa.schema([
+        ('rank', pa.int32()),
+        ('battleTag', pa.string()),
+        ('riftLevel', pa.int32()),
+        ('riftTime', pa.int64()),
+        ('completedTime', pa.int64()),
+        ('heroBattleTag', pa.string()),
+        ('heroClass', pa.string()),
+        ('heroId', pa.int64()),
+        ('heroLevel', pa.int32()),
+        ('heroGender', pa.string()),
+        ('paragonLevel', pa.int32()),
+        ('clanTag', pa.string()),
+        ('clanName', pa.string()),
+        ('leaderboard', pa.string()),
+    ])
+
+
+class SnapshotNotFound(LookupError):
+    pass
+
+
+def available():
+    return pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for leaderboard snapshots (pip install pyarrow)")
+
+
+# Region and leaderboard name become path segments: refuse anything that
+# could leave SNAPSHOT_DIR
+def snapshot_path(region, season_id, leaderboard_name):
+    for part in (region, leaderboard_name):
+        if not part or part in ('.', '..') or '/' in part or os.sep in part or (os.altsep and os.altsep in part):
+            raise ValueError(f"Invalid snapshot path segment: {part!r}")
+    return os.path.join(SNAPSHOT_DIR, region, f"season-{season_id}", f"{leaderboard_name}.arrow")
+
+
+def has_snapshot(region, season_id, leaderboard_name):
+    return available() and os.path.exists(snapshot_path(region, season_id, leaderboard_name))
+
+
+# Whether the saved snapshot is final (only its schema is read)
+def has_final_snapshot(region, season_id, leaderboard_name):
+    if not has_snapshot(region, season_id, leaderboard_name):
+        return False
+    with pa.memory_map(snapshot_path(region, season_id, leaderboard_name), 'r') as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return metadata.get(b'final') == b'1'
+
+
+# Persist flat leaderboard rows. 'final' marks the leaderboard of a finished
+# season, which the API may then serve instead of asking Blizzard. The file
+# is written next to its final location and renamed into place, so readers
+# never see a partial file.
+def write_snapshot(region, season_id, leaderboard_name, rows, final=False):
+    _require_pyarrow()
+    if isinstance(rows, pa.Table):
+        table = rows.cast(SCHEMA)
+    else:
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+    table = table.replace_schema_metadata({
+        'region': region,
+        'season_id': str(season_id),
+        'leaderboard': leaderboard_name,
+        'written_at': str(time.time()),
+        'final': '1' if final else '0',
+    })
+
+    path = snapshot_path(region, season_id, leaderboard_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+# Memory-map a snapshot as an Arrow table (no copy of the column data)
+def read_snapshot(region, season_id, leaderboard_name):
+    _require_pyarrow()
+    path = snapshot_path(region, season_id, leaderboard_name)
+    if not os.path.exists(path):
+        raise SnapshotNotFound(path)
+    # The map stays open for as long as the returned table references it
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+# Snapshot rows as flat dicts, in the format the API serves
+def load_rows(region, season_id, leaderboard_name):
+    return read_snapshot(region, season_id, leaderboard_name).to_pylist()
+
+
+# Rows of a final snapshot, or None when there is no final snapshot
+def load_final_rows(region, season_id, leaderboard_name):
+    if not has_snapshot(region, season_id, leaderboard_name):
+        return None
+    table = read_snapshot(region, season_id, leaderboard_name)
+    if (table.schema.metadata or {}).get(b'final') != b'1':
+        return None
+    return table.to_pylist()
+
+
+# All saved class leaderboards of a season as one pandas DataFrame
+def load_dataframe(season_id, region="us", leaderboards=None):
+    _require_pyarrow()
+    tables = [
+        read_snapshot(region, season_id, name)
+        for name in (leaderboards or RIFT_LEADERBOARDS)
+        if has_snapshot(region, season_id, name)
+    ]
+    if not tables:
+        raise SnapshotNotFound(f"No snapshots for {region} season {season_id}")
+    return pa.concat_tables(tables).to_pandas()
+
+
+# (region, season_id, leaderboard) of every saved snapshot
+def list_snapshots():
+    found = []
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return found
+    for region in sorted(os.listdir(SNAPSHOT_DIR)):
+        region_dir = os.path.join(SNAPSHOT_DIR, region)
+        for season_dir in sorted(os.listdir(region_dir)):
+            if not season_dir.startswith('season-'):
+                continue
+            for name in sorted(os.listdir(os.path.join(region_dir, season_dir))):
+                if name.endswith('.arrow'):
+                    found.append((region, int(season_dir[len('season-'):]), name[:-len('.arrow')]))
+    return found
@@ -23,6 +23,9 @@ const classNames = {
 };
 
 const playersPerPage = 50;
+const classLimit = 1000;  // Blizzard leaderboards hold up to 1000 rows
+const allClassesLimit = 7000;  // 7 class leaderboards of up to 1000 rows
+const leaderboardFields = 'rank,battleTag,riftLevel,riftTime,completedTime,leaderboard';
 let currentPage = 1;
 let totalPages = 1;
 let leaderboardData = [];
@@ -75,38 +78,15 @@ async function fetchLeaderboard() {
     const classSlug = document.getElementById('class').value;
 
     try {
-        let data = [];
         if (classSlug === 'all') {
-            // Fetch leaderboard for all classes
-            const classes = ['rift-barbarian', 'rift-wizard', 'rift-dh', 'rift-monk', 'rift-necromancer', 'rift-wd', 'rift-crusader'];
-            const promises = classes.map(async (cls) => {
-                const res = await fetch(`/api/leaderboard?season_id=${season}&leaderboard_name=${cls}`);
-                const leaderboardData = await res.json();
-                const rows = leaderboardData.row || [];
-                return rows.map(row => ({ ...row, classSlug: cls }));  // Add classSlug to each row
-            });
-            // Flatten the array of arrays
-            const results = await Promise.all(promises);
-            data = results.flat();
+            // The server fetches every class leaderboard and returns them already merged and sorted
+            const response = await fetch(`/api/leaderboard/all?season_id=${season}&limit=${allClassesLimit}&fields=${leaderboardFields}`);
+            leaderboardData = (await response.json()).rows || [];
         } else {
-            const response = await fetch(`/api/leaderboard?season_id=${season}&leaderboard_name=${classSlug}`);
-            data = (await response.json()).row || [];
+            const response = await fetch(`/api/leaderboard?season_id=${season}&leaderboard_name=${classSlug}&format=flat&limit=${classLimit}&fields=${leaderboardFields}`);
+            leaderboardData = (await response.json()).rows || [];
         }
 
-        leaderboardData = data.sort((a, b) => {
-            const riftLevelA = getRiftLevel(a);
-            const riftTimeA = getRiftTime(a);
-            const riftLevelB = getRiftLevel(b);
-            const riftTimeB = getRiftTime(b);
-
-            // Sort by rift level descending, and by rift time ascending (faster is better)
-            if (riftLevelA !== riftLevelB) {
-                return riftLevelB - riftLevelA;
-            } else {
-                return riftTimeA - riftTimeB;
-            }
-        });
-
         filteredData = leaderboardData;
         totalPages = Math.ceil(filteredData.length / playersPerPage);
         currentPage = 1;
@@ -116,22 +96,6 @@ async function fetchLeaderboard() {
         console.error('Error fetching leaderboard:', error);
     }
 }
-// Sort leaderboard by rift level and rift time (higher rift level first, then by fastest time)
-function sortLeaderboard(data) {
-    return data.sort((a, b) => {
-        const riftLevelA = getRiftLevel(a);
-        const riftTimeA = getRiftTime(a);
-        const riftLevelB = getRiftLevel(b);
-        const riftTimeB = getRiftTime(b);
-
-        // Sort by rift level descending, and by rift time ascending (faster is better)
-        if (riftLevelA !== riftLevelB) {
-            return riftLevelB - riftLevelA;
-        } else {
-            return riftTimeA - riftTimeB;
-        }
-    });
-}
 // Function to update table headers based on whether searching by class or all classes
 function updateTableHeaders(isPlayerSearch) {
     const tableHead = document.getElementById('leaderboardTable').getElementsByTagName('thead')[0];
@@ -167,22 +131,18 @@ function displayLeaderboard(isPlayerSearch = false) {
             return;
         }
 
-        // Sort the leaderboard data before displaying
-        const sortedData = sortLeaderboard(filteredData);
-
+        // Rows are kept sorted since they were fetched, filtering preserves the order
         const startIndex = (currentPage - 1) * playersPerPage;
-        const endIndex = Math.min(startIndex + playersPerPage, sortedData.length);
-        const pageData = sortedData.slice(startIndex, endIndex);
+        const endIndex = Math.min(startIndex + playersPerPage, filteredData.length);
+        const pageData = filteredData.slice(startIndex, endIndex);
 
         pageData.forEach(row => {
-            const rank = row.data.find(d => d.id === 'Rank')?.number || 'Unknown';
-            const battleTag = row.data.find(d => d.id === 'BattleTag')?.string || 'Unknown';
+            const rank = row.rank || 'Unknown';
+            const battleTag = row.battleTag || 'Unknown';
             const riftLevel = getRiftLevel(row);
             const riftTime = msToTime(getRiftTime(row));
-            const completedTime = row.data.find(d => d.id === 'CompletedTime')?.timestamp
-                ? new Date(row.data.find(d => d.id === 'CompletedTime').timestamp).toLocaleString()
-                : 'N/A';
-            const classUsed = classNames[row.classSlug] || 'Unknown';
+            const completedTime = row.completedTime ? new Date(row.completedTime).toLocaleString() : 'N/A';
+            const classUsed = classNames[row.leaderboard] || 'Unknown';
 
             const newRow = leaderboardTableBody.insertRow();
             newRow.insertCell(0).innerText = rank;
@@ -233,7 +193,7 @@ function searchPlayer() {
         displayLeaderboard(true);  // Call the function with true to ensure class column is shown
     } else {
         filteredData = leaderboardData.filter(row => {
-            const battleTag = row.data.find(d => d.id === 'BattleTag')?.string.toLowerCase();
+            const battleTag = row.battleTag?.toLowerCase();
             return battleTag && battleTag.includes(searchQuery);
         });
 
@@ -558,17 +518,15 @@ async function fetchItemTypeDetails() {
 //#region Character
 async function fetchCharacterDetails(account) {
     try {
-        const [profileResponse, accountProfileResponse] = await Promise.all([
-            fetch(`/api/character/${encodeURIComponent(account)}`),
-            fetch(`/api/account/${encodeURIComponent(account)}`)
-        ]);
+        // One round trip: the server fetches the profile once and returns it with the heroes
+        const response = await fetch(`/api/character/${encodeURIComponent(account)}/full?fields=profile`);
 
-        if (!profileResponse.ok || !accountProfileResponse.ok) {
+        if (!response.ok) {
             throw new Error("Failed to fetch character or account data");
         }
 
-        const profileData = await profileResponse.json();
-        const accountProfileData = await accountProfileResponse.json();
+        const profileData = await response.json();
+        const accountProfileData = profileData.profile;
 
         console.log("Profile Data:", accountProfileData);  // Debugging output
 
@@ -674,12 +632,10 @@ function displayAccountAchievements(achievements) {
 }
 // Helper functions to extract rift level and time
 function getRiftLevel(row) {
-    const riftLevel = row.data.find(d => d.id === 'RiftLevel')?.number;
-    return riftLevel || 0;
+    return row.riftLevel || 0;
 }
 function getRiftTime(row) {
-    const riftTime = row.data.find(d => d.id === 'RiftTime')?.timestamp;
-    return riftTime || 0;
+    return row.riftTime || 0;
 }
 // Function to view character details
 async function viewCharacterDetails(battleTag) {
@@ -0,0 +1,165 @@
+import uuid
+import logging
+import threading
+import contextvars
+
+# Metrics in the Prometheus text format, request trace ids and the logging
+# setup that stamps every log line with the trace id of its request.
+# Metrics are per process: with several workers, scrape each one.
+
+# Trace id of the request being served ('-' outside of requests). Copied into
+# the client loop along with the rest of the request context, so upstream
+# calls and background refreshes they start log under the same id.
+trace_id = contextvars.ContextVar('trace_id', default='-')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    # 'read' makes the gauge report read() at scrape time instead of a stored value
+    def __init__(self, name, help, labels=(), read=None):
+        super().__init__(name, help, labels)
+        self._read = read
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._read is not None:
+            return [(self.name, (), self._read())]
+        return super().samples()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), count))
+                samples.append((f"{self.name}_sum", key, counts[-2]))
+                samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), read=None):
+        return self.register(Gauge(name, help, labels, read))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    # Every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', "Time spent serving requests", ('route', 'method', 'status'))
+http_requests_in_flight = registry.gauge(
+    'http_requests_in_flight', "Requests being served")
+upstream_request_duration = registry.histogram(
+    'upstream_request_duration_seconds', "Blizzard API call latency, retries included", ('ttl_class', 'status'))
+upstream_requests_in_flight = registry.gauge(
+    'upstream_requests_in_flight', "Blizzard API calls in progress")
+upstream_retries = registry.counter(
+    'upstream_retries_total', "Blizzard API calls retried", ('reason',))
+cache_lookups = registry.counter(
+    'cache_lookups_total', "Upstream response cache lookups by result (hit, stale, miss)", ('ttl_class', 'result'))
+token_refreshes = registry.counter(
+    'oauth_token_refreshes_total', "OAuth token requests", ('result',))
+
+
+# Stamp every log record with the current trace id (as %(trace_id)s)
+def install_log_trace_ids():
+    factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = trace_id.get()
+        return record
+
+    logging.setLogRecordFactory(record_factory)